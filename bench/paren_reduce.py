@@ -0,0 +1,73 @@
+# Micro-benchmark: the old recursive paren_reduce vs. the stack tokenizer.
+# Run from the source tree: python bench/paren_reduce.py [repeat]
+
+import os
+import sys
+import timeit
+import builtins
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+builtins.__dict__.setdefault("_", lambda s: s)
+
+from portato.helper import paren_reduce
+
+
+def legacy_paren_reduce(mystr):
+
+    mylist = []
+    while mystr:
+        left_paren = mystr.find("(")
+        has_left_paren = left_paren != -1
+        right_paren = mystr.find(")")
+        has_right_paren = right_paren != -1
+        if not has_left_paren and not has_right_paren:
+            freesec = mystr
+            subsec = None
+            tail = ""
+        elif mystr[0] == ")":
+            return [mylist, mystr[1:]]
+        elif has_left_paren and not has_right_paren:
+            return []
+        elif has_left_paren and left_paren < right_paren:
+            freesec, subsec = mystr.split("(", 1)
+            subsec, tail = legacy_paren_reduce(subsec)
+        else:
+            subsec, tail = mystr.split(")", 1)
+            subsec = [_f for _f in subsec.split(" ") if _f]
+            return [mylist + subsec, tail]
+        mystr = tail
+        if freesec:
+            mylist = mylist + [_f for _f in freesec.split(" ") if _f]
+        if subsec is not None:
+            mylist = mylist + [subsec]
+    return mylist
+
+
+def meta_depend(n):
+
+    # shaped like kde-apps/kde-apps-meta or texlive: many USE-guarded groups
+    parts = []
+    for i in range(n):
+        parts.append(
+            "flag%d? ( >=kde-apps/pkg%d-23.08:5 || ( dev-libs/a%d dev-libs/b%d ) )" % (i, i, i, i)
+        )
+    return " ".join(parts)
+
+
+def main(repeat=5):
+
+    for n in (10, 100, 1000, 5000):
+        deps = meta_depend(n)
+        assert paren_reduce(deps) == legacy_paren_reduce(deps)
+
+        number = max(1, 2000 // n)
+        old = min(timeit.repeat(lambda: legacy_paren_reduce(deps), number=number, repeat=repeat))
+        new = min(timeit.repeat(lambda: paren_reduce(deps), number=number, repeat=repeat))
+        print(
+            "%5d groups (%7d chars): legacy %8.3f ms  stack %8.3f ms  (x%.1f)"
+            % (n, len(deps), old / number * 1000, new / number * 1000, old / new)
+        )
+
+
+if __name__ == "__main__":
+    main(*map(int, sys.argv[1:]))
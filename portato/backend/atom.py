@@ -0,0 +1,180 @@
+import re
+from functools import lru_cache
+
+from .config_index import split_criterion
+
+MATCHER_CACHE_SIZE = 4096
+
+OPERATOR = re.compile(r"^(?P<op>~|!{0,2}[<>]?=?)")
+SLOT = re.compile(r"(?<!:):(?!:)(?P<slot>[\w+][\w+.-]*(?:/[\w+][\w+.-]*)?)")
+VERSION = re.compile(
+    r"^(?P<nums>[0-9]+(?:\.[0-9]+)*)(?P<letter>[a-z]?)"
+    r"(?P<suffixes>(?:_(?:alpha|beta|pre|rc|p)[0-9]*)*)(?:-r(?P<rev>[0-9]+))?$"
+)
+SUFFIX = re.compile(r"_(alpha|beta|pre|rc|p)([0-9]*)")
+
+SUFFIX_RANK = {"alpha": 0, "beta": 1, "pre": 2, "rc": 3, "p": 5}
+NO_SUFFIX = (4, 0)
+
+
+def _component(c):
+
+    if c.startswith("0"):
+        return (0, c.rstrip("0"))
+    else:
+        return (1, int(c))
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def version_key(version):
+
+    m = VERSION.match(version)
+    if m is None:
+        raise ValueError("Invalid version: %s" % version)
+
+    nums = m.group("nums").split(".")
+    suffixes = tuple(
+        (SUFFIX_RANK[s], int(n or 0)) for s, n in SUFFIX.findall(m.group("suffixes"))
+    ) + (NO_SUFFIX,)
+
+    return (
+        int(nums[0]),
+        tuple(_component(c) for c in nums[1:]),
+        m.group("letter"),
+        suffixes,
+        int(m.group("rev") or 0),
+    )
+
+
+def glob_matcher(version):
+
+    # =cat/pkg-<version>* only wildcards the components after the given
+    # ones: 3.1* matches 3.1 and 3.1.4, but not 3.12; _rc* any _rcN
+    spec = version_key(version)
+    suffixes = SUFFIX.findall(version)
+    has_rev = "-r" in version
+    open_suffix = bool(suffixes) and not suffixes[-1][1] and not has_rev
+
+    def match(key):
+
+        if key[0] != spec[0]:
+            return False
+
+        if not (spec[2] or suffixes or has_rev):
+            return key[1][:len(spec[1])] == spec[1]
+
+        if key[1] != spec[1] or key[2] != spec[2]:
+            return False
+
+        if has_rev:
+            return key[3] == spec[3] and key[4] == spec[4]
+
+        n = len(suffixes)
+        if n == 0:
+            return True
+
+        last, want = key[3][n - 1], spec[3][n - 1]
+        if key[3][:n - 1] != spec[3][:n - 1] or last == NO_SUFFIX:
+            return False
+        return last[0] == want[0] if open_suffix else last == want
+
+    return match
+
+
+def split_cpv(cpv):
+
+    split = split_criterion("=" + cpv)
+    if split is None or split[1] is None:
+        return None
+
+    cat, name = split[0].split("/", 1)
+    return cat, name, split[1]
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def split_cpv_key(cpv):
+
+    cp, version = split_criterion("=" + cpv)
+    return cp, version, version_key(version)
+
+
+class Criterion(object):
+
+    __slots__ = ("crit", "op", "cp", "version", "key", "slot", "glob")
+
+    def __init__(self, crit):
+
+        split = split_criterion(crit)
+        if split is None:
+            raise ValueError("Invalid criterion: %s" % crit)
+
+        self.crit = crit
+        self.cp, self.version = split
+        self.op = OPERATOR.match(crit).group("op") or ""
+        self.key = None
+        self.glob = None
+
+        m = SLOT.search(crit)
+        self.slot = m.group("slot") if m is not None else None
+
+        if self.version is not None:
+            if self.version.endswith("*"):
+                self.version = self.version[:-1]
+                self.glob = glob_matcher(self.version)
+            else:
+                self.key = version_key(self.version)
+        elif self.op and not self.is_blocker():
+            raise ValueError("Operator without version: %s" % crit)
+
+    def __repr__(self):
+        return "<Criterion '%s'>" % self.crit
+
+    def is_blocker(self):
+        return self.op.startswith("!")
+
+    def match_version(self, version, key):
+
+        op = self.op
+        if self.version is None:
+            return True
+        elif self.key is None:  # =cat/pkg-1*
+            return op == "=" and self.glob(key)
+        elif op == "=":
+            return key == self.key
+        elif op == "~":
+            return key[:-1] == self.key[:-1]
+        elif op == ">=":
+            return key >= self.key
+        elif op == ">":
+            return key > self.key
+        elif op == "<=":
+            return key <= self.key
+        elif op == "<":
+            return key < self.key
+        else:  # blockers and junk never match
+            return False
+
+    def match_slot(self, slot):
+
+        if "/" in self.slot:
+            return slot == self.slot
+        else:
+            return slot.split("/")[0] == self.slot
+
+    def matches(self, pkg):
+
+        if self.is_blocker():
+            return False
+
+        cp, version, key = split_cpv_key(pkg.get_cpv())
+        return (
+            cp == self.cp
+            and self.match_version(version, key)
+            and (self.slot is None or self.match_slot(pkg.get_slot()))
+        )
+
+
+@lru_cache(maxsize=MATCHER_CACHE_SIZE)
+def compile_criterion(crit):
+
+    return Criterion(crit)
@@ -0,0 +1,264 @@
+import os
+import io
+import re
+import time
+import stat
+import itertools as itt
+from threading import RLock
+from concurrent.futures import ThreadPoolExecutor
+
+from ..helper import debug
+
+# seconds between two stat-sweeps over the same config root;
+# None disables the sweeps and relies on invalidate() (see ConfigWatcher)
+STAT_INTERVAL = 1.0
+
+# worker threads used to stat and parse the files of a config directory
+SCAN_THREADS = 8
+
+# directories skipped by portage when reading package.* directories
+VCS_DIRS = ("CVS", "RCS", "SCCS", ".bzr", ".git", ".hg", ".svn")
+
+CRITERION = re.compile(
+    r"^[<>=!~]{0,4}"
+    r"(?P<cp>[\w+][\w+.-]*/[\w+][\w+-]*?)"
+    r"(?:-(?P<version>[0-9]+(?:\.[0-9]+)*[a-z]?"
+    r"(?:_(?:alpha|beta|pre|rc|p)[0-9]*)*(?:-r[0-9]+)?\*?))?"
+    r"(?:::?[^\[]*)?(?:\[.*\])?$"
+)
+
+
+def split_criterion(crit):
+
+    m = CRITERION.match(crit)
+    if m is None:
+        return None
+
+    return m.group("cp"), m.group("version")
+
+
+def stamp_of(st):
+
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class ConfigFile(object):
+
+    __slots__ = ("path", "stamp", "lines", "entries")
+
+    def __init__(self, path, stamp, lines, entries=None):
+
+        self.path = path
+        self.stamp = stamp
+        self.lines = lines
+
+        if entries is not None:
+            self.entries = entries
+            return
+
+        self.entries = {}
+        for no, line in enumerate(lines, 1):
+            fl = line.split()
+            if not fl or fl[0][0] == "#":
+                continue
+
+            crit = fl[0]
+            split = split_criterion(crit)
+            if split is None:
+                continue
+
+            nc = list(itt.takewhile(lambda x: x[0] != "#", fl[1:]))
+            self.entries.setdefault(split[0], []).append((path, str(no), crit, nc))
+
+    @classmethod
+    def read(cls, path, st=None):
+
+        if st is None:
+            st = os.stat(path)
+
+        with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+            return cls(path, stamp_of(st), f.readlines())
+
+
+class _Root(object):
+
+    __slots__ = ("files", "by_cp", "checked", "generation")
+
+    def __init__(self):
+
+        self.files = []
+        self.by_cp = {}
+        self.checked = None
+        self.generation = 0
+
+
+class ConfigIndex(object):
+    def __init__(self, interval=STAT_INTERVAL, threads=SCAN_THREADS):
+
+        self.interval = interval
+        self.threads = threads
+        self._lock = RLock()
+        self._files = {}
+        self._roots = {}
+
+    def list_files(self, root):
+
+        # same order and filtering as portage.util._recursive_file_list:
+        # depth-first, entries sorted by name, no hidden or backup files
+        found = []
+        stack = [os.path.split(root.rstrip("/") or "/")]
+        while stack:
+            parent, name = stack.pop()
+            path = os.path.join(parent, name)
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+
+            if stat.S_ISDIR(st.st_mode):
+                if name in VCS_DIRS:
+                    continue
+                try:
+                    children = sorted(os.listdir(path), reverse=True)
+                except OSError:
+                    continue
+                stack.extend((path, c) for c in children if not (c.startswith(".") or c.endswith("~")))
+            else:
+                found.append(path)
+
+        return found
+
+    def _load(self, path):
+
+        try:
+            st = os.stat(path)
+            cf = self._files.get(path)
+            if cf is None or cf.stamp != stamp_of(st):
+                debug("Parsing config file '%s'.", path)
+                cf = ConfigFile.read(path, st)
+        except (OSError, IOError) as e:
+            debug("Cannot read config file '%s': %s", path, e)
+            cf = None
+
+        return path, cf
+
+    def scan(self, paths):
+
+        if len(paths) < 2 * self.threads:
+            return list(map(self._load, paths))
+
+        with ThreadPoolExecutor(self.threads) as pool:
+            return list(pool.map(self._load, paths))
+
+    def get_file(self, path, check=True):
+
+        with self._lock:
+            if not check and path in self._files:
+                return self._files[path]
+
+            try:
+                st = os.stat(path)
+            except OSError:
+                self._files.pop(path, None)
+                return None
+
+            cf = self._files.get(path)
+            if cf is None or cf.stamp != stamp_of(st):
+                debug("Parsing config file '%s'.", path)
+                cf = self._files[path] = ConfigFile.read(path, st)
+
+            return cf
+
+    def _validate(self, root):
+
+        r = self._roots.get(root)
+        if r is None:
+            r = self._roots[root] = _Root()
+
+        now = time.time()
+        if r.checked is not None and (self.interval is None or now - r.checked < self.interval):
+            return r
+
+        changed = False
+        files = []
+        for path, cf in self.scan(self.list_files(root)):
+            if cf is None:
+                self._files.pop(path, None)
+                continue
+
+            files.append(path)
+            if self._files.get(path) is not cf:
+                self._files[path] = cf
+                changed = True
+
+        if changed or files != r.files:
+            r.by_cp = {}
+            for path in files:
+                for cp, records in self._files[path].entries.items():
+                    r.by_cp.setdefault(cp, []).extend(records)
+            r.files = files
+            r.generation += 1
+
+        r.checked = now
+        return r
+
+    def lookup(self, cp, root):
+
+        with self._lock:
+            return list(self._validate(root).by_cp.get(cp, ()))
+
+    def generation(self, root):
+
+        with self._lock:
+            return self._validate(root).generation
+
+    def cps(self, root):
+
+        with self._lock:
+            return list(self._validate(root).by_cp.keys())
+
+    def lookup_many(self, cps, root):
+
+        with self._lock:
+            by_cp = self._validate(root).by_cp
+            return dict((cp, list(by_cp.get(cp, ()))) for cp in cps)
+
+    def adopt(self, cf):
+
+        with self._lock:
+            self._files.setdefault(cf.path, cf)
+
+    def files(self):
+
+        with self._lock:
+            return list(self._files.values())
+
+    def refresh_file(self, path):
+
+        with self._lock:
+            old = self._files.get(path)
+            cps = set(old.entries) if old is not None else set()
+            self.invalidate(path)
+
+            if os.path.isfile(path):
+                cf = self.get_file(path)
+                if cf is not None:
+                    cps.update(cf.entries)
+
+            return cps
+
+    def invalidate(self, path=None):
+
+        with self._lock:
+            if path is None:
+                self._files.clear()
+                self._roots.clear()
+            else:
+                self._files.pop(path, None)
+                for root, r in self._roots.items():
+                    if path == root or path.startswith(root.rstrip("/") + "/"):
+                        r.checked = None
+
+
+INDEX = ConfigIndex()  # shared by the backend, the USE resolver and the GUI
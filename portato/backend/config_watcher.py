@@ -0,0 +1,189 @@
+import os
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+from threading import Thread, Event
+
+from ..helper import debug, warning
+from .config_index import stamp_of
+
+try:
+    _libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+    _libc.inotify_init1
+except (OSError, AttributeError):
+    _libc = None
+
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (
+    IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO
+    | IN_CREATE | IN_DELETE | IN_DELETE_SELF
+)
+
+EVENT = struct.Struct("iIII")
+
+POLL_INTERVAL = 2.0  # seconds between two sweeps of the polling fallback
+SETTLE_TIME = 0.2  # collect events this long before dispatching them
+
+
+class ConfigWatcher(Thread):
+    def __init__(self, path, index=None, poll_interval=POLL_INTERVAL):
+
+        Thread.__init__(self, name="Config-Watcher-Thread", daemon=True)
+
+        self.path = path
+        self.index = index
+        self.poll_interval = poll_interval
+
+        self._callbacks = []
+        self._halt = Event()
+        self._fd = None
+        self._wds = {}
+
+    def connect(self, callback):
+
+        self._callbacks.append(callback)
+
+    def emit(self, paths):
+
+        paths = sorted(paths)
+        cps = set()
+        if self.index is not None:
+            for path in paths:
+                cps.update(self.index.refresh_file(path))
+
+        debug("Config change in %s (affects %d packages).", paths, len(cps))
+        for cb in self._callbacks:
+            try:
+                cb(paths, cps)
+            except Exception as e:
+                warning("Config change callback %r failed: %s", cb, e)
+
+    def stop(self):
+
+        self._halt.set()
+
+    def run(self):
+
+        if _libc is not None:
+            self._fd = _libc.inotify_init1(IN_CLOEXEC)
+
+        if self._fd is None or self._fd < 0:
+            debug("inotify not available, polling '%s'.", self.path)
+            self._fd = None
+            self._run_poll()
+            return
+
+        saved = None
+        if self.index is not None:
+            saved, self.index.interval = self.index.interval, None
+        try:
+            self._add_tree(self.path)
+            self._run_inotify()
+        finally:
+            os.close(self._fd)
+            if self.index is not None:
+                self.index.interval = saved
+
+    # inotify
+
+    def _add_watch(self, dir):
+
+        wd = _libc.inotify_add_watch(self._fd, os.fsencode(dir), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err not in (errno.ENOENT, errno.ENOTDIR):
+                warning("Cannot watch '%s': %s", dir, os.strerror(err))
+        else:
+            self._wds[wd] = dir
+
+    def _add_tree(self, root):
+
+        for dir, dirs, files in os.walk(root):
+            self._add_watch(dir)
+
+    def _read_events(self, timeout):
+
+        ready = select.select([self._fd], [], [], timeout)[0]
+        if not ready:
+            return []
+
+        buf = os.read(self._fd, 64 * 1024)
+        events = []
+        pos = 0
+        while pos < len(buf):
+            wd, mask, cookie, length = EVENT.unpack_from(buf, pos)
+            pos += EVENT.size
+            name = buf[pos:pos + length].rstrip(b"\0")
+            pos += length
+            events.append((wd, mask, os.fsdecode(name)))
+
+        return events
+
+    def _run_inotify(self):
+
+        while not self._halt.is_set():
+            events = self._read_events(1.0)
+            if not events:
+                continue
+
+            deadline = time.time() + SETTLE_TIME
+            while time.time() < deadline:
+                events.extend(self._read_events(max(0, deadline - time.time())))
+
+            paths = set()
+            for wd, mask, name in events:
+                if mask & IN_IGNORED:
+                    self._wds.pop(wd, None)
+                    continue
+
+                dir = self._wds.get(wd)
+                if dir is None:
+                    continue
+
+                path = os.path.join(dir, name) if name else dir
+                if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_tree(path)
+
+                paths.add(path)
+
+            if paths:
+                self.emit(paths)
+
+    # polling fallback
+
+    def _scan(self):
+
+        found = {}
+        for dir, dirs, files in os.walk(self.path):
+            for f in files:
+                path = os.path.join(dir, f)
+                try:
+                    found[path] = stamp_of(os.stat(path))
+                except OSError:
+                    pass
+        return found
+
+    def _run_poll(self):
+
+        old = self._scan()
+        while not self._halt.wait(self.poll_interval):
+            new = self._scan()
+            paths = set(p for p in new if old.get(p) != new[p])
+            paths.update(p for p in old if p not in new)
+            old = new
+
+            if paths:
+                self.emit(paths)
@@ -0,0 +1,190 @@
+import json
+from collections import deque
+
+from ..helper import debug, DependencyStringError
+from ..dependency import AllOf, AnyOf, flatten, parse_dependencies
+from .installed import INSTALLED
+
+GRAPH_KEYS = ("RDEPEND", "PDEPEND")
+
+
+class DependencyGraph(object):
+    def __init__(self):
+
+        self.names = []  # id -> name
+        self.ids = {}  # name -> id
+        self.edges = []  # id -> [id]
+        self.unresolved = {}  # id -> [atom]
+
+    def __len__(self):
+        return len(self.names)
+
+    def add_node(self, name):
+
+        try:
+            return self.ids[name]
+        except KeyError:
+            id = len(self.names)
+            self.ids[name] = id
+            self.names.append(name)
+            self.edges.append([])
+            return id
+
+    def add_edge(self, a, b):
+
+        if b not in self.edges[a]:
+            self.edges[a].append(b)
+
+    def _pick(self, item, resolve):
+
+        # the packages an AllOf item pulls in; for || the first alternative
+        # that resolves completely wins, like portage prefers the leftmost one
+        if isinstance(item, AnyOf):
+            for alt in item:
+                found = self._pick(alt, resolve)
+                if found is not None:
+                    return found
+            return None
+
+        if isinstance(item, AllOf):
+            found = []
+            for i in item:
+                f = self._pick(i, resolve)
+                if f is None:
+                    return None
+                found.extend(f)
+            return found
+
+        if item.startswith("!"):
+            return []
+
+        pkg = resolve(item)
+        return None if pkg is None else [pkg]
+
+    def build(self, roots, resolve, dependencies, use_of=lambda pkg: ()):
+
+        # resolve(atom) -> pkg or None; dependencies(pkg) -> DependencyTree;
+        # packages need a 'cpv' attribute and are expanded once each
+        todo = deque()
+        for pkg in roots:
+            if pkg.cpv not in self.ids:
+                self.add_node(pkg.cpv)
+                todo.append(pkg)
+
+        while todo:
+            pkg = todo.popleft()
+            id = self.ids[pkg.cpv]
+
+            for item in flatten(dependencies(pkg), use_of(pkg)):
+                found = self._pick(item, resolve)
+                if found is None:
+                    self.unresolved.setdefault(id, []).append(str(item))
+                    continue
+
+                for dep in found:
+                    if dep.cpv not in self.ids:
+                        todo.append(dep)
+                    self.add_edge(id, self.add_node(dep.cpv))
+
+        debug("Dependency graph: %d nodes, %d edges.", len(self), sum(map(len, self.edges)))
+        return self
+
+    def scc(self):
+
+        # iterative Tarjan, so deep chains do not hit the recursion limit
+        index = [None] * len(self.names)
+        low = [0] * len(self.names)
+        on_stack = [False] * len(self.names)
+        stack = []
+        components = []
+        counter = 0
+
+        for start in range(len(self.names)):
+            if index[start] is not None:
+                continue
+
+            work = [(start, 0)]
+            while work:
+                v, i = work[-1]
+                if i == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+
+                edges = self.edges[v]
+                if i < len(edges):
+                    work[-1] = (v, i + 1)
+                    w = edges[i]
+                    if index[w] is None:
+                        work.append((w, 0))
+                    elif on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                    continue
+
+                work.pop()
+                if work:
+                    u = work[-1][0]
+                    low[u] = min(low[u], low[v])
+
+                if low[v] == index[v]:
+                    comp = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp.append(w)
+                        if w == v:
+                            break
+                    components.append(comp)
+
+        return components
+
+    def cycles(self):
+
+        return [
+            sorted(self.names[i] for i in comp)
+            for comp in self.scc()
+            if len(comp) > 1 or comp[0] in self.edges[comp[0]]
+        ]
+
+    def write_jsonl(self, out):
+
+        for id, name in enumerate(self.names):
+            node = {"id": id, "name": name, "deps": self.edges[id]}
+            if id in self.unresolved:
+                node["unresolved"] = self.unresolved[id]
+            out.write(json.dumps(node) + "\n")
+
+    def write_dot(self, out):
+
+        out.write("digraph dependencies {\n")
+        for id, name in enumerate(self.names):
+            out.write('  n%d [label="%s"];\n' % (id, name))
+        for id, edges in enumerate(self.edges):
+            for dep in edges:
+                out.write("  n%d -> n%d;\n" % (id, dep))
+        out.write("}\n")
+
+
+def installed_graph(roots=None, installed=INSTALLED):
+
+    def dependencies(pkg):
+        try:
+            return parse_dependencies(" ".join(pkg.get(k) for k in GRAPH_KEYS))
+        except DependencyStringError:
+            return parse_dependencies("")
+
+    def resolve(atom):
+        try:
+            return installed.best_match(atom)
+        except ValueError:
+            return None
+
+    if roots is None:
+        pkgs = installed.packages()
+    else:
+        pkgs = [p for atom in roots for p in installed.match(atom)]
+
+    return DependencyGraph().build(
+        sorted(pkgs, key=lambda p: p.cpv), resolve, dependencies, lambda pkg: pkg.get("USE").split()
+    )
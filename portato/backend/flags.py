@@ -1,8 +1,14 @@
 import os
-import itertools as itt
-from subprocess import Popen, PIPE # This is for grep. - Montana.
+import atexit
 
 from . import system, is_package
+from .config_index import INDEX
+from .transaction import Transaction, diff_files
+from .snapshot import ConfigSnapshot
+from .config_watcher import ConfigWatcher
+from .journal import Journal, USE, MASK, UNMASK, TESTING
+from .ranges import RangeIndex
+from .metadata import METADATA, GLOBAL
 from ..helper import debug, error, warning
 
 CONFIG = {
@@ -24,11 +30,22 @@ class Constants:
         self._mask_path = None
         self._unmask_path = None
         self._testing_path = None
+        self._accept_keywords_path = None
+        self._keywords_path = None
         self._use_path_is_dir = None
         self._mask_path_is_dir = None
         self._unmask_path_is_dir = None
         self._testing_path_is_dir = None
 
+    def invalidate(self, path):
+        for name in ("use", "mask", "unmask", "testing"):
+            if self.__dict__["_%s_path" % name] == path:
+                self.__dict__["_%s_path_is_dir" % name] = None
+
+        if path in (self._accept_keywords_path, self._keywords_path):
+            self._testing_path = None
+            self._testing_path_is_dir = None
+
     def __get(self, name, path):
         if self.__dict__[name] is None:
             self.__dict__[name] = os.path.join(system.get_config_path(), path)
@@ -59,8 +76,30 @@ class Constants:
     def unmask_path_is_dir(self):
         return self.__is_dir("unmask_path")
 
+    def accept_keywords_path(self):
+        return self.__get("_accept_keywords_path", "package.accept_keywords")
+
+    def keywords_path(self):
+        return self.__get("_keywords_path", "package.keywords")
+
     def testing_path(self):
-        return self.__get("_testing_path", "package.keywords")
+        # new entries go to package.accept_keywords, unless only the
+        # legacy package.keywords exists
+        if self._testing_path is None:
+            if os.path.exists(self.keywords_path()) and not os.path.exists(
+                self.accept_keywords_path()
+            ):
+                self._testing_path = self.keywords_path()
+            else:
+                self._testing_path = self.accept_keywords_path()
+
+        return self._testing_path
+
+    def testing_paths(self):
+        return [
+            p for p in (self.accept_keywords_path(), self.keywords_path())
+            if os.path.exists(p)
+        ] or [self.testing_path()]
 
     def testing_path_is_dir(self):
         return self.__is_dir("testing_path")
@@ -69,36 +108,87 @@ class Constants:
 CONST = Constants()
 
 
-def grep(pkg, path):
+RANGES = RangeIndex(INDEX)
+SNAPSHOT = None
 
-    if not is_package(pkg):
-        pkg = system.new_package(pkg)  
-
-    if os.path.exists(path):
-        command = "egrep -x -n -r -H '^[<>!=~]{0,2}%s(-[0-9].*)?[[:space:]]?.*$' %s"  
-        return (
-            Popen((command % (pkg.get_cp(), path)), shell=True, stdout=PIPE)
-            .communicate()[0]
-            .splitlines()
-        )
-    else:
-        return []
+
+def load_snapshot():
+
+    global SNAPSHOT
+
+    if SNAPSHOT is None:
+        SNAPSHOT = ConfigSnapshot(system.get_config_path()).load()
+        SNAPSHOT.restore(INDEX)
+        atexit.register(save_snapshot)
+
+    return SNAPSHOT
+
+
+def save_snapshot():
+
+    if SNAPSHOT is not None:
+        SNAPSHOT.save(INDEX)
+
+
+WATCHER = None
+
+
+def config_changed(paths, cps):
+
+    for path in paths:
+        CONST.invalidate(path)
+
+    METADATA.invalidate(scope=GLOBAL)
+
+    for cpv in list(useFlags.keys()):
+        cat, pkg = system.split_cpv(cpv)[:2]
+        if "%s/%s" % (cat, pkg) in cps:
+            del useFlags[cpv]
+
+
+def watch_config(callback=None):
+
+    global WATCHER
+
+    if WATCHER is None:
+        load_snapshot()
+        WATCHER = ConfigWatcher(system.get_config_path(), INDEX)
+        WATCHER.connect(config_changed)
+        WATCHER.start()
+
+    if callback is not None:
+        WATCHER.connect(callback)
+
+    return WATCHER
 
 
 def get_data(pkg, path):
 
-    flags = []
+    if not is_package(pkg):
+        pkg = system.new_package(pkg)
+
+    load_snapshot()
+    return INDEX.lookup(pkg.get_cp(), path)
+
+
+def get_matching_data(pkg, path):
+
+    if not is_package(pkg):
+        pkg = system.new_package(pkg)
 
-    for line in grep(pkg, path):
-        file, line, fl = line.split(":", 2) 
-        fl = fl.split()
-        crit = fl[0]
-        fl = fl[1:]
+    load_snapshot()
+    return RANGES.query(pkg, path)
 
-        nc = itt.takewhile(lambda x: x[0] != "#", fl)
-        flags.append((file, line, crit, list(nc)))
 
-    return flags
+def find_stale_entries(path):
+
+    def packages_of(cp):
+        pkgs = [system.new_package(cpv) for cpv in system.find_packages(cp, masked=True, only_cpv=True)]
+        METADATA.prefetch(pkgs, ("SLOT",))
+        return pkgs
+
+    load_snapshot()
+    return RANGES.stale(path, packages_of)
 
 
 def set_config(cfg):
@@ -134,7 +224,7 @@ def generate_path(cpv, exp):
 
 
 useFlags = {}  #
-newUseFlags = {}
+JOURNAL = Journal()
 
 
 def invert_use_flag(flag):
@@ -167,7 +257,7 @@ def filter_defaults(flaglist):
 
 def set_use_flag(pkg, flag):
 
-    global useFlags, newUseFlags
+    global useFlags
 
     if not is_package(pkg):
         pkg = system.new_package(pkg)
@@ -177,37 +267,35 @@ def set_use_flag(pkg, flag):
 
     data = None
     if not cpv in useFlags:
-        data = get_data(pkg, CONST.use_path())
+        data = get_matching_data(pkg, CONST.use_path())
         useFlags[cpv] = data
     else:
         data = useFlags[cpv]
 
-    if not cpv in newUseFlags:
-        newUseFlags[cpv] = []
-
     debug("data: %s", str(data))
-    added = False
-    for file, line, crit, flags in data:
-        if pkg.matches(crit):
+    with JOURNAL.group():
+        added = False
+        last = None
+        for file, line, crit, flags in data:
             if (
                 invFlag in flags
-                or (file, line, invFlag, False) in newUseFlags[cpv]
-                or (file, line, flag, True) in newUseFlags[cpv]
+                or JOURNAL.has(USE, cpv, file, line, invFlag, False)
+                or JOURNAL.has(USE, cpv, file, line, flag, True)
             ):
-                if added:
-                    del newUseFlags[cpv][-1]
+                if added and last is not None:
+                    JOURNAL.discard(*last)
                 added = True
                 jumpOut = False
-                for t in ((file, line, invFlag, False), (file, line, flag, True)):
-                    if t in newUseFlags[cpv]:
-                        newUseFlags[cpv].remove(t)
+                for f, remove in ((invFlag, False), (flag, True)):
+                    if JOURNAL.has(USE, cpv, file, line, f, remove):
+                        JOURNAL.discard(USE, cpv, file, line, f)
                         jumpOut = True
 
                 if not jumpOut:
-                    newUseFlags[cpv].append((file, line, invFlag, True))
+                    JOURNAL.add(USE, cpv, file, line, invFlag, True)
 
                     if invFlag in pkg.get_actual_use_flags():
-                        newUseFlags[cpv].append((file, line, flag, False))
+                        JOURNAL.add(USE, cpv, file, line, flag, False)
                 break
 
             elif flag in flags:
@@ -216,20 +304,47 @@ def set_use_flag(pkg, flag):
 
             else:
                 if not added:
-                    newUseFlags[cpv].append((file, line, flag, False))
+                    if JOURNAL.add(USE, cpv, file, line, flag, False):
+                        last = (USE, cpv, file, line, flag)
                 added = True
 
-    if not added:
-        path = CONST.use_path()
-        if CONST.use_path_is_dir():
-            path = os.path.join(CONST.use_path(), generate_path(cpv, CONFIG["usefile"]))
-        try:
-            newUseFlags[cpv].remove((path, -1, invFlag, False))
-        except ValueError:  # not in UseFlags
-            newUseFlags[cpv].append((path, -1, flag, False))
+        if not added:
+            path = CONST.use_path()
+            if CONST.use_path_is_dir():
+                path = os.path.join(CONST.use_path(), generate_path(cpv, CONFIG["usefile"]))
+
+            if not JOURNAL.discard(USE, cpv, path, -1, invFlag):
+                JOURNAL.add(USE, cpv, path, -1, flag, False)
+
+    debug("new use flags: %s", JOURNAL.changes(USE, cpv))
+
+
+def set_use_flags(changes):
 
-    newUseFlags[cpv] = list(set(newUseFlags[cpv]))
-    debug("newUseFlags: %s", str(newUseFlags))
+    pkgs = []
+    for pkg, flags in changes:
+        if not is_package(pkg):
+            pkg = system.new_package(pkg)
+        pkgs.append((pkg, flags))
+
+    load_snapshot()
+    missing = [pkg for pkg, flags in pkgs if pkg.get_cpv() not in useFlags]
+    METADATA.prefetch(missing, ("SLOT",))
+    for pkg, data in zip(missing, RANGES.query_many(missing, CONST.use_path())):
+        useFlags[pkg.get_cpv()] = data
+
+    for pkg, flags in pkgs:
+        for flag in flags:
+            set_use_flag(pkg, flag)
+
+    return [pkg for pkg, flags in pkgs]
+
+
+def find_use_target(atom):
+
+    # the cpv 'portato use' and the GUI stage flags for: installed first
+    return (system.find_best_match(atom, only_installed=True, only_cpv=True)
+            or system.find_best_match(atom, only_cpv=True))
 
 
 def remove_new_use_flags(cpv):
@@ -237,10 +352,7 @@ def remove_new_use_flags(cpv):
     if is_package(cpv):
         cpv = cpv.get_cpv()
 
-    try:
-        del newUseFlags[cpv]
-    except KeyError:
-        pass
+    JOURNAL.clear(USE, cpv)
 
 
 def get_new_use_flags(cpv):
@@ -249,200 +361,168 @@ def get_new_use_flags(cpv):
         cpv = cpv.get_cpv()
 
     list2return = set()
-    try:
-        for file, line, flag, remove in newUseFlags[cpv]:
-            if remove:
-                list2return.add("~" + invert_use_flag(flag))
-            else:
-                list2return.add(flag)
-    except KeyError:
-        pass
+    for c in JOURNAL.changes(USE, cpv):
+        if c.remove:
+            list2return.add("~" + invert_use_flag(c.flag))
+        else:
+            list2return.add(c.flag)
 
     return list(list2return)
 
 
-def write_use_flags():
+def undo_change():
 
-    global newUseFlags, useFlags
+    return JOURNAL.undo()
 
-    def combine(list):
-        return " ".join(list) + "\n"
 
-    def insert(flag, list):
-        list.insert(1, flag)
+def redo_change():
 
-    def remove(flag, list):
-        list.remove(flag)
+    return JOURNAL.redo()
 
-        if len(list) == 1 or list[1][0] == "#":
-            list[0] = "#" + list[0]
-            list.append("#removed by portato#")
 
-    file_cache = {}
-    for cpv in newUseFlags:
-        flagsToAdd = []
+def _combine(list):
+    return " ".join(list) + "\n"
 
-        newUseFlags[cpv].sort(key=lambda x: x[3])  #
-        for file, line, flag, delete in newUseFlags[cpv]:
-            line = int(line)
 
-            if line == -1:
-                flagsToAdd.append(flag)
+def _comment_out(line):
+    return "#" + line.rstrip("\n") + " # removed by portato\n"
 
-            else:
-                if not file in file_cache:
-                    with open(file, "r") as f:
-                        lines = []
-                        i = 1
-                        while i < line:
-                            lines.append(f.readline())
-                            i += 1
-                        l = f.readline().split()
 
-                        if delete:
-                            remove(flag, l)
-                        else:
-                            insert(flag, l)
-                        lines.append(combine(l))
+def stage_use_flags(trans):
 
-                        lines.extend(f.readlines())
+    def insert(flag):
+        def fn(line):
+            l = line.split()
+            l.insert(1, flag)
+            return _combine(l)
 
-                        file_cache[file] = lines
+        return fn
 
-                else:
-                    l = file_cache[file][line - 1].split()
-                    if delete:
-                        remove(flag, l)
-                    else:
-                        insert(flag, l)
-                    file_cache[file][line - 1] = combine(l)
+    def remove(flag):
+        def fn(line):
+            l = line.split()
+            l.remove(flag)
+
+            if len(l) == 1 or l[1][0] == "#":
+                l[0] = "#" + l[0]
+                l.append("#removed by portato#")
+
+            return _combine(l)
+
+        return fn
+
+    for cpv in JOURNAL.cpvs(USE):
+        flagsToAdd = {}
 
-        if flagsToAdd:
+        for c in sorted(JOURNAL.changes(USE, cpv), key=lambda c: c.remove):
+            if c.is_append():
+                flagsToAdd.setdefault(c.file, []).append(c.flag)
+            elif c.remove:
+                trans.edit(c.file, c.line, remove(c.flag))
+            else:
+                trans.edit(c.file, c.line, insert(c.flag))
 
+        for file, flags in flagsToAdd.items():
             msg = "\n#portato update#\n"
-            comb = combine(flagsToAdd)
+            comb = _combine(flags)
             if CONFIG["usePerVersion"]:
                 msg += "=%s %s" % (cpv, comb)
             else:
                 list = system.split_cpv(cpv)
                 msg += "%s/%s %s" % (list[0], list[1], comb)
 
-            if not file in file_cache:
-                with open(file, "a") as f:
-                    f.write(msg)
-            else:
-                file_cache[file].append(msg)
-
-    for file in file_cache:
-        with open(file, "w") as f:
-            f.writelines(file_cache[file])
-
-    useFlags = {}
-    newUseFlags = {}
-    system.reload_settings()
+            trans.append(file, msg)
 
 
-new_masked = {}
-new_unmasked = {}
+def write_use_flags():
+    write_changes(masked=False, testing=False)
 
 
 def set_masked(pkg, masked=True):
 
-    global new_masked, newunmasked
-
     if not is_package(pkg):
         pkg = system.new_package(pkg)
 
     cpv = pkg.get_cpv()
 
-    if not cpv in new_unmasked:
-        new_unmasked[cpv] = []
-    if not cpv in new_masked:
-        new_masked[cpv] = []
-
     if masked:
-        link_neq = new_masked
-        link_eq = new_unmasked
+        link_neq = MASK
+        link_eq = UNMASK
         path = CONST.unmask_path()
     else:
-        link_neq = new_unmasked
-        link_eq = new_masked
+        link_neq = UNMASK
+        link_eq = MASK
         path = CONST.mask_path()
 
-    copy = link_eq[cpv][:]
-    for file, line in copy:
-        if line == "-1":
-            link_eq[cpv].remove((file, line))
+    with JOURNAL.group():
+        for c in JOURNAL.changes(link_eq, cpv):
+            if c.is_append():
+                JOURNAL.discard(link_eq, cpv, c.file, c.line)
 
-    copy = link_neq[cpv][:]
-    for file, line in copy:
-        if line != "-1":
-            link_neq[cpv].remove((file, line))
+        for c in JOURNAL.changes(link_neq, cpv):
+            if not c.is_append():
+                JOURNAL.discard(link_neq, cpv, c.file, c.line)
 
-    if masked == pkg.is_masked():
-        return
+        if masked == pkg.is_masked():
+            return
 
-    data = get_data(pkg, path)
-    debug("data: %s", str(data))
-    done = False
-    for file, line, crit, flags in data:
-        if pkg.matches(crit):
-            link_eq[cpv].append((file, line))
+        data = get_matching_data(pkg, path)
+        debug("data: %s", str(data))
+        done = False
+        for file, line, crit, flags in data:
+            JOURNAL.add(link_eq, cpv, file, line)
             done = True
 
-    if done:
-        return
+        if done:
+            return
 
-    if masked:
-        is_dir = CONST.mask_path_is_dir()
-        path = CONST.mask_path()
-    else:
-        is_dir = CONST.unmask_path_is_dir()
-        path = CONST.unmask_path()
+        if masked:
+            is_dir = CONST.mask_path_is_dir()
+            path = CONST.mask_path()
+        else:
+            is_dir = CONST.unmask_path_is_dir()
+            path = CONST.unmask_path()
 
-    if is_dir:
-        file = os.path.join(path, generate_path(cpv, CONFIG["maskfile"]))
-    else:
-        file = path
+        if is_dir:
+            file = os.path.join(path, generate_path(cpv, CONFIG["maskfile"]))
+        else:
+            file = path
 
-    link_neq[cpv].append((file, "-1"))
-    link_neq[cpv] = list(set(link_neq[cpv]))
-    debug("new_(un)masked: %s", str(link_neq))
+        JOURNAL.add(link_neq, cpv, file, "-1")
+
+    debug("new_(un)masked: %s", JOURNAL.changes(link_neq, cpv))
 
 
 def remove_new_masked(cpv):
     if is_package(cpv):
         cpv = cpv.get_cpv()
 
-    try:
-        del new_masked[cpv]
-    except KeyError:
-        pass
-
-    try:
-        del new_unmasked[cpv]
-    except KeyError:
-        pass
+    with JOURNAL.group():
+        JOURNAL.clear(MASK, cpv)
+        JOURNAL.clear(UNMASK, cpv)
 
 
 def new_masking_status(cpv):
     if is_package(cpv):
         cpv = cpv.get_cpv()
 
-    def get(list):
-        ret = None
-        if cpv in list and list[cpv] != []:
-            for file, line in list[cpv]:
-                _ret = int(line) == -1
-                if ret is not None and _ret != ret:
-                    error(_("Conflicting values for masking status: %s"), list)
-                else:
-                    ret = _ret
-        return ret
+    def get(kind):
+        appends = JOURNAL.count_appends(kind, cpv)
+        edits = JOURNAL.count(kind, cpv) - appends
+
+        if appends and edits:
+            error(_("Conflicting values for masking status: %s"), JOURNAL.changes(kind, cpv))
+
+        if appends:
+            return True
+        elif edits:
+            return False
+        else:
+            return None
 
-    masked = get(new_masked)
+    masked = get(MASK)
     if masked is None:
-        masked = get(new_unmasked)
+        masked = get(UNMASK)
         if masked is not None:
             masked = not masked
 
@@ -463,83 +543,41 @@ def is_locally_masked(pkg, changes=True):
     if changes:
         if new_masking_status(pkg) == "masked":
 
-            if pkg.get_cpv() in new_unmasked:
-                if new_unmasked[pkg.get_cpv()]:
-                    return False
+            if JOURNAL.count(UNMASK, pkg.get_cpv()):
+                return False
 
             return True
 
         if new_masking_status(pkg) == "unmasked":
             return False
 
-    list = get_data(pkg, CONST.mask_path())
-
-    if not list:
-        return False
-
-    for file, line, crit, fl in list:
-        if pkg.matches(crit):
-            return True
-
-    return False
-
+    return bool(get_matching_data(pkg, CONST.mask_path()))
 
-def write_masked():
-    global new_unmasked, new_masked
-    file_cache = {}
 
-    def write(cpv, file, line):
-        line = int(line)
+def stage_masked(trans):
 
-        if line == -1:
+    def stage(cpv, file, line):
+        if int(line) == -1:
             msg = "\n#portato update#\n"
             if CONFIG["maskPerVersion"]:
                 msg += "=%s\n" % cpv
             else:
                 list = system.split_cpv(cpv)
                 msg += "%s/%s\n" % (list[0], list[1])
-            if not file in file_cache:
-                with open(file, "a") as f:
-                    f.write(msg)
-            else:
-                file_cache[file].append(msg)
+            trans.append(file, msg)
         else:
-            if not file in file_cache:
-                with open(file, "r") as f:
-                    lines = []
-                    i = 1
-                    while i < line:
-                        lines.append(f.readline())
-                        i = i + 1
-                    l = f.readline()
-                    l = "#" + l[:-1] + " # removed by portato\n"
-                    lines.append(l)
-
-                    lines.extend(f.readlines())
-
-                    file_cache[file] = lines
-                l = file_cache[file][line - 1]
-                l = "#" + l[:-1] + " # removed by portato\n"
-                file_cache[file][line - 1] = l
-
-    for cpv in new_masked:
-        for file, line in new_masked[cpv]:
-            write(cpv, file, line)
-
-    for cpv in new_unmasked:
-        for file, line in new_unmasked[cpv]:
-            write(cpv, file, line)
-
-    for file in file_cache.keys():
-        f = open(file, "w")
-        f.writelines(file_cache[file])
-        f.close()
-    new_masked = {}
-    new_unmasked = {}
-    system.reload_settings()
-
-
-newTesting = {}
+            trans.edit(file, line, _comment_out)
+
+    for kind in (MASK, UNMASK):
+        for cpv in JOURNAL.cpvs(kind):
+            for c in JOURNAL.changes(kind, cpv):
+                stage(cpv, c.file, c.line)
+
+
+def write_masked():
+    write_changes(use=False, testing=False)
+
+
 arch = ""
 
 
@@ -547,116 +585,128 @@ def remove_new_testing(cpv):
     if is_package(cpv):
         cpv = cpv.get_cpv()
 
-    try:
-        del newTesting[cpv]
-    except KeyError:
-        pass
+    JOURNAL.clear(TESTING, cpv)
 
 
 def new_testing_status(cpv):
     if is_package(cpv):
         cpv = cpv.get_cpv()
 
-    if cpv in newTesting:
-        for file, line in newTesting[cpv]:
-            if line == "-1":
-                return False
-            else:
-                return True
+    if JOURNAL.count_appends(TESTING, cpv):
+        return False
+    elif JOURNAL.count(TESTING, cpv):
+        return True
 
     return None
 
 
 def set_testing(pkg, enable):
 
-    global arch, newTesting
+    global arch
     if not is_package(pkg):
         pkg = system.new_package(pkg)
 
     arch = pkg.get_global_settings("ARCH")
     cpv = pkg.get_cpv()
-    if not cpv in newTesting:
-        newTesting[cpv] = []
-
-    for file, line in newTesting[cpv][:]:
-        if (enable and line != "-1") or (not enable and line == "-1"):
-            newTesting[cpv].remove((file, line))
-
-    if (enable and not pkg.is_testing()) or (not enable and pkg.is_testing()):
-        return
-
-    if not enable:
-        test = get_data(pkg, CONST.testing_path())
-        debug("data (test): %s", str(test))
-        for file, line, crit, flags in test:
-            try:
-                flagMatches = flags[0] == "~" + arch
-            except IndexError:  # no flags
-                warning(
-                    _("Line %(line)s in file %(file)s misses a keyword (e.g. '~x86')."),
-                    {"line": line, "file": file},
-                )
-                debug("No keyword. Assuming match.")
-                flagMatches = True
 
-            if pkg.matches(crit) and flagMatches:
-                newTesting[cpv].append((file, line))
-    else:
-        if CONST.testing_path_is_dir():
-            file = os.path.join(
-                CONST.testing_path(), generate_path(cpv, CONFIG["testingfile"])
-            )
+    with JOURNAL.group():
+        for c in JOURNAL.changes(TESTING, cpv):
+            if enable != c.is_append():
+                JOURNAL.discard(TESTING, cpv, c.file, c.line)
+
+        if (enable and not pkg.is_testing()) or (not enable and pkg.is_testing()):
+            return
+
+        if not enable:
+            test = []
+            for path in CONST.testing_paths():
+                test.extend(get_matching_data(pkg, path))
+            debug("data (test): %s", str(test))
+            for file, line, crit, flags in test:
+                try:
+                    flagMatches = flags[0] == "~" + arch
+                except IndexError:  # no flags
+                    warning(
+                        _("Line %(line)s in file %(file)s misses a keyword (e.g. '~x86')."),
+                        {"line": line, "file": file},
+                    )
+                    debug("No keyword. Assuming match.")
+                    flagMatches = True
+
+                if flagMatches:
+                    JOURNAL.add(TESTING, cpv, file, line)
         else:
-            file = CONST.testing_path()
-        newTesting[cpv].append((file, "-1"))
+            if CONST.testing_path_is_dir():
+                file = os.path.join(
+                    CONST.testing_path(), generate_path(cpv, CONFIG["testingfile"])
+                )
+            else:
+                file = CONST.testing_path()
+            JOURNAL.add(TESTING, cpv, file, "-1")
 
-    newTesting[cpv] = list(set(newTesting[cpv]))
-    debug("newTesting: %s", str(newTesting))
+    debug("new testing: %s", JOURNAL.changes(TESTING, cpv))
 
 
-def write_testing():
-    global arch, newTesting
-    file_cache = {}
+def stage_testing(trans):
 
-    for cpv in newTesting:
-        for file, line in newTesting[cpv]:
-            line = int(line)
-            if line == -1:
+    for cpv in JOURNAL.cpvs(TESTING):
+        for c in JOURNAL.changes(TESTING, cpv):
+            file, line = c.file, c.line
+            if c.is_append():
                 msg = "\n#portato update#\n"
                 if CONFIG["testingPerVersion"]:
                     msg += "=%s ~%s\n" % (cpv, arch)
                 else:
                     list = system.split_cpv(cpv)
                     msg += "%s/%s ~%s\n" % (list[0], list[1], arch)
-                if not file in file_cache:
-                    with open(file, "a") as f:
-                        f.write(msg)
-                else:
-                    file_cache[file].append(msg)
+                trans.append(file, msg)
             else:
-                if not file in file_cache:
+                trans.edit(file, line, _comment_out)
+
 
-                    with open(file, "r") as f:
-                        lines = []
-                        i = 1
-                        while i < line:
-                            lines.append(f.readline())
-                            i = i + 1
+def write_testing():
+    write_changes(use=False, masked=False)
 
-                        l = f.readline()
-                        l = "#" + l[:-1] + " # removed by portato\n"
-                        lines.append(l)
 
-                        lines.extend(f.readlines())
+def diff_changes(use=True, masked=True, testing=True):
 
-                        file_cache[file] = lines
-                else:
-                    l = file_cache[file][line - 1]
-                    l = "#" + l[:-1] + " # removed by portato\n"
-                    file_cache[file][line - 1] = l
-
-    for file in file_cache.keys():
-        with open(file, "w") as f:
-            f.writelines(file_cache[file])
-    newTesting = {}
-    system.reload_settings()
+    trans = Transaction()
+    if use:
+        stage_use_flags(trans)
+    if masked:
+        stage_masked(trans)
+    if testing:
+        stage_testing(trans)
+
+    return diff_files(trans, INDEX, check=False)
+
+
+def write_changes(use=True, masked=True, testing=True):
+
+    global useFlags
+
+    trans = Transaction()
+    kinds = []
+    if use:
+        stage_use_flags(trans)
+        kinds.append(USE)
+    if masked:
+        stage_masked(trans)
+        kinds.extend((MASK, UNMASK))
+    if testing:
+        stage_testing(trans)
+        kinds.append(TESTING)
+
+    files = trans.commit(INDEX)
+
+    if use:
+        useFlags = {}
+    JOURNAL.reset(kinds)
+
+    for file in files:
+        INDEX.invalidate(file)
+
+    if files:
+        save_snapshot()
+        system.reload_settings()
+        METADATA.invalidate(scope=GLOBAL)
@@ -0,0 +1,198 @@
+import os
+import io
+from bisect import insort
+from threading import RLock
+from concurrent.futures import ThreadPoolExecutor
+
+from ..helper import debug
+from .atom import compile_criterion, split_cpv, version_key
+from .config_index import SCAN_THREADS
+
+VDB_PATH = "/var/db/pkg"
+
+
+def read_vdb_file(path, name):
+
+    try:
+        with io.open(os.path.join(path, name), "r", encoding="utf-8", errors="replace") as f:
+            return f.read().strip()
+    except (IOError, OSError):
+        return ""
+
+
+def read_vdb_int(path, name):
+
+    try:
+        return int(read_vdb_file(path, name) or 0)
+    except ValueError:
+        return 0
+
+
+class InstalledPackage(object):
+
+    __slots__ = ("cpv", "cp", "version", "key", "slot", "use", "size", "build_time", "path")
+
+    def __init__(self, cpv, path):
+
+        cat, name, self.version = split_cpv(cpv)
+        self.cpv = cpv
+        self.cp = "/".join((cat, name))
+        self.key = version_key(self.version)
+        self.slot = read_vdb_file(path, "SLOT") or "0"
+        self.use = read_vdb_file(path, "USE")
+        self.size = read_vdb_int(path, "SIZE")
+        self.build_time = read_vdb_int(path, "BUILD_TIME")
+        self.path = path
+
+    def __lt__(self, b):
+        return self.key < b.key
+
+    def __repr__(self):
+        return "<InstalledPackage '%s:%s'>" % (self.cpv, self.slot)
+
+    def get(self, name):
+
+        return read_vdb_file(self.path, name)
+
+
+class InstalledIndex(object):
+    def __init__(self, path=VDB_PATH, threads=SCAN_THREADS):
+
+        self.path = path
+        self.threads = threads
+        self._lock = RLock()
+        self._categories = {}  # category -> (mtime_ns, [InstalledPackage])
+        self._by_cp = {}  # cp -> [InstalledPackage], sorted by version
+        self.listeners = []  # called with the cpvs of changed categories
+
+    def _read_category(self, cat):
+
+        cpath = os.path.join(self.path, cat)
+        pkgs = []
+        try:
+            names = os.listdir(cpath)
+        except OSError:
+            return pkgs
+
+        for pf in names:
+            if pf.startswith((".", "-")):  # -MERGING-*, lockfiles
+                continue
+
+            cpv = "/".join((cat, pf))
+            if split_cpv(cpv) is None:
+                debug("Skipping malformed vdb entry '%s'.", cpv)
+                continue
+
+            pkgs.append(InstalledPackage(cpv, os.path.join(cpath, pf)))
+
+        return pkgs
+
+    def refresh(self):
+
+        try:
+            cats = [c for c in os.listdir(self.path) if not c.startswith(".")]
+        except OSError:
+            cats = []
+
+        with self._lock:
+            changed = False
+            touched = []
+            for cat in set(self._categories) - set(cats):
+                touched.extend(p.cpv for p in self._categories.pop(cat)[1])
+                changed = True
+
+            stale = []
+            for cat in cats:
+                try:
+                    mtime = os.stat(os.path.join(self.path, cat)).st_mtime_ns
+                except OSError:
+                    continue
+
+                cached = self._categories.get(cat)
+                if cached is None or cached[0] != mtime:
+                    stale.append((cat, mtime))
+
+            if len(stale) > 1:
+                with ThreadPoolExecutor(self.threads) as pool:
+                    read = list(pool.map(self._read_category, [cat for cat, mtime in stale]))
+            else:
+                read = [self._read_category(cat) for cat, mtime in stale]
+
+            for (cat, mtime), pkgs in zip(stale, read):
+                if cat in self._categories:
+                    touched.extend(p.cpv for p in self._categories[cat][1])
+                touched.extend(p.cpv for p in pkgs)
+                self._categories[cat] = (mtime, pkgs)
+                changed = True
+
+            if changed:
+                by_cp = {}
+                for mtime, pkgs in self._categories.values():
+                    for p in pkgs:
+                        insort(by_cp.setdefault(p.cp, []), p)
+                self._by_cp = by_cp
+
+                for listener in self.listeners:
+                    listener(touched)
+
+            return changed
+
+    def _packages(self, cp):
+
+        if not self._categories:
+            self.refresh()
+
+        return self._by_cp.get(cp, ())
+
+    def cps(self):
+
+        if not self._categories:
+            self.refresh()
+
+        return list(self._by_cp.keys())
+
+    def packages(self, cp=None):
+
+        if cp is not None:
+            return list(self._packages(cp))
+
+        if not self._categories:
+            self.refresh()
+
+        return [p for pkgs in self._by_cp.values() for p in pkgs]
+
+    def slots(self, cp):
+
+        return sorted(set(p.slot for p in self._packages(cp)))
+
+    def match(self, crit):
+
+        c = compile_criterion(crit)
+        if c.is_blocker():
+            c = compile_criterion(crit.lstrip("!"))
+
+        return [
+            p for p in self._packages(c.cp)
+            if c.match_version(p.version, p.key)
+            and (c.slot is None or c.match_slot(p.slot))
+        ]
+
+    def best_match(self, crit):
+
+        found = self.match(crit)
+        return found[-1] if found else None
+
+    def satisfies(self, crit):
+
+        try:
+            found = bool(self.match(crit))
+        except ValueError:
+            debug("Cannot evaluate dependency '%s'.", crit)
+            return False
+
+        if crit.startswith("!"):
+            return not found
+        return found
+
+
+INSTALLED = InstalledIndex()
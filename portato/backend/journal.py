@@ -0,0 +1,200 @@
+from contextlib import contextmanager
+
+USE = "use"
+MASK = "mask"
+UNMASK = "unmask"
+TESTING = "testing"
+
+
+class Change(object):
+
+    __slots__ = ("kind", "cpv", "file", "line", "flag", "remove")
+
+    def __init__(self, kind, cpv, file, line, flag=None, remove=False):
+
+        self.kind = kind
+        self.cpv = cpv
+        self.file = file
+        self.line = line
+        self.flag = flag
+        self.remove = remove
+
+    @property
+    def key(self):
+        return (self.file, self.line, self.flag)
+
+    def is_append(self):
+        return self.line == "-1"
+
+    def __repr__(self):
+        return "<Change %s %s %s:%s %s%s>" % (
+            self.kind, self.cpv, self.file, self.line,
+            "-" if self.remove else "+", self.flag,
+        )
+
+
+class Journal(object):
+    def __init__(self):
+
+        self._entries = {}  # (kind, cpv) -> {(file, line, flag): Change}
+        self._appends = {}  # (kind, cpv) -> number of appending changes
+        self._undo = []
+        self._redo = []
+        self._group = None
+
+    # raw operations
+
+    def _insert(self, c):
+
+        self._entries.setdefault((c.kind, c.cpv), {})[c.key] = c
+        if c.is_append():
+            self._appends[(c.kind, c.cpv)] = self._appends.get((c.kind, c.cpv), 0) + 1
+
+    def _delete(self, c):
+
+        slot = (c.kind, c.cpv)
+        entries = self._entries[slot]
+        del entries[c.key]
+        if not entries:
+            del self._entries[slot]
+
+        if c.is_append():
+            self._appends[slot] -= 1
+            if not self._appends[slot]:
+                del self._appends[slot]
+
+    def _log(self, op, c):
+
+        if self._group is not None:
+            self._group.append((op, c))
+        else:
+            self._undo.append([(op, c)])
+            self._redo = []
+
+    @contextmanager
+    def group(self):
+
+        if self._group is not None:  # nested -> part of the outer group
+            yield
+            return
+
+        self._group = []
+        try:
+            yield
+        finally:
+            group, self._group = self._group, None
+            if group:
+                self._undo.append(group)
+                self._redo = []
+
+    # queries
+
+    def get(self, kind, cpv, file, line, flag=None):
+
+        entries = self._entries.get((kind, cpv))
+        if entries is None:
+            return None
+
+        return entries.get((file, str(line), flag))
+
+    def has(self, kind, cpv, file, line, flag=None, remove=None):
+
+        c = self.get(kind, cpv, file, line, flag)
+        return c is not None and (remove is None or c.remove == remove)
+
+    def changes(self, kind, cpv):
+
+        return list(self._entries.get((kind, cpv), {}).values())
+
+    def cpvs(self, kind):
+
+        return [cpv for k, cpv in self._entries if k == kind]
+
+    def count(self, kind, cpv):
+
+        return len(self._entries.get((kind, cpv), ()))
+
+    def count_appends(self, kind, cpv):
+
+        return self._appends.get((kind, cpv), 0)
+
+    # modifications
+
+    def add(self, kind, cpv, file, line, flag=None, remove=False):
+
+        line = str(line)
+        old = self.get(kind, cpv, file, line, flag)
+        if old is not None:
+            if old.remove == remove:
+                return False
+            self._delete(old)
+            self._log("del", old)
+
+        c = Change(kind, cpv, file, line, flag, remove)
+        self._insert(c)
+        self._log("add", c)
+        return True
+
+    def discard(self, kind, cpv, file, line, flag=None):
+
+        c = self.get(kind, cpv, file, line, flag)
+        if c is None:
+            return False
+
+        self._delete(c)
+        self._log("del", c)
+        return True
+
+    def clear(self, kind, cpv):
+
+        with self.group():
+            for c in self.changes(kind, cpv):
+                self._delete(c)
+                self._log("del", c)
+
+    def reset(self, kinds=None):
+
+        for slot in list(self._entries.keys()):
+            if kinds is None or slot[0] in kinds:
+                del self._entries[slot]
+                self._appends.pop(slot, None)
+
+        self._undo = []
+        self._redo = []
+
+    # history
+
+    def _apply(self, group, reverse):
+
+        ops = reversed(group) if reverse else group
+        for op, c in ops:
+            if (op == "add") != reverse:
+                self._insert(c)
+            else:
+                self._delete(c)
+
+    def can_undo(self):
+        return bool(self._undo)
+
+    def can_redo(self):
+        return bool(self._redo)
+
+    def undo(self):
+
+        if not self._undo:
+            return None
+
+        group = self._undo.pop()
+        self._apply(group, True)
+        self._redo.append(group)
+        return [c for op, c in group]
+
+    def redo(self):
+
+        if not self._redo:
+            return None
+
+        group = self._redo.pop()
+        self._apply(group, False)
+        self._undo.append(group)
+        return [c for op, c in group]
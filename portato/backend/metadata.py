@@ -0,0 +1,149 @@
+import os
+from collections import OrderedDict
+from threading import Lock
+from concurrent.futures import ThreadPoolExecutor
+
+from . import system
+from .config_index import SCAN_THREADS
+from .installed import INSTALLED, read_vdb_file
+from .repo_cache import REPO_CACHE
+
+METADATA_CACHE_SIZE = 50000
+
+PACKAGE = "pkg"
+GLOBAL = "global"
+
+
+class MetadataCache(object):
+    def __init__(self, size=METADATA_CACHE_SIZE):
+
+        self.size = size
+        self._data = OrderedDict()  # (cpv, scope, key, installed) -> value
+        self._lock = Lock()
+
+    def _store(self, cpv, scope, key, installed, value):
+
+        with self._lock:
+            self._data[(cpv, scope, key, installed)] = value
+            self._data.move_to_end((cpv, scope, key, installed))
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def lookup(self, cpv, scope, key, installed):
+
+        with self._lock:
+            try:
+                value = self._data[(cpv, scope, key, installed)]
+            except KeyError:
+                return False, None
+
+            self._data.move_to_end((cpv, scope, key, installed))
+            return True, value
+
+    def get(self, pkg, scope, key, installed=True):
+
+        cpv = pkg.get_cpv()
+        found, value = self.lookup(cpv, scope, key, installed)
+        if not found:
+            if scope == GLOBAL:
+                value = pkg.get_global_settings(key, installed=installed)
+            else:
+                value = pkg.get_package_settings(key, installed=installed)
+            self._store(cpv, scope, key, installed, value)
+
+        return value
+
+    def get_system(self, key):
+
+        found, value = self.lookup(None, GLOBAL, key, True)
+        if not found:
+            value = system.get_global_settings(key)
+            self._store(None, GLOBAL, key, True, value)
+
+        return value
+
+    def prefetch(self, pkgs, keys, installed=True):
+
+        todo = []
+        for pkg in pkgs:
+            missing = [
+                k for k in keys
+                if not self.lookup(pkg.get_cpv(), PACKAGE, k, installed)[0]
+            ]
+            if missing:
+                todo.append((pkg, missing))
+
+        if not todo:
+            return
+
+        found = read_package_settings(
+            [(pkg.get_cpv(), missing) for pkg, missing in todo], installed
+        )
+        for (pkg, missing), values in zip(todo, found):
+            if values is None:  # neither in the vdb nor in the repository index
+                values = pkg.get_package_settings_many(missing, installed=installed)
+            for k in missing:
+                self._store(pkg.get_cpv(), PACKAGE, k, installed, values[k])
+
+    def invalidate(self, cpv=None, scope=None):
+
+        with self._lock:
+            if cpv is None and scope is None:
+                self._data.clear()
+                return
+
+            for k in [
+                k for k in self._data
+                if (cpv is None or k[0] == cpv) and (scope is None or k[1] == scope)
+            ]:
+                del self._data[k]
+
+    def invalidate_packages(self, cpvs):
+
+        # merges, unmerges and syncs: drop the package entries of these cpvs
+        cpvs = set(cpvs)
+        with self._lock:
+            for k in [k for k in self._data if k[1] == PACKAGE and k[0] in cpvs]:
+                del self._data[k]
+
+
+def _read_settings(item):
+
+    # all wanted keys of one package with one read of its md5-cache entry
+    # (or its vdb files); None if neither knows the package
+    cpv, keys, installed = item
+    if installed:
+        path = os.path.join(INSTALLED.path, cpv)
+        if os.path.isdir(path):
+            return dict((k, read_vdb_file(path, k)) for k in keys)
+
+    e = REPO_CACHE.get(cpv) if REPO_CACHE.is_open() else None
+    if e is None:
+        return None
+
+    try:
+        data = e.read()
+    except (IOError, OSError):
+        return None
+    return dict((k, data.get(k, "")) for k in keys)
+
+
+def read_package_settings(items, installed=True):
+
+    # items: [(cpv, keys)]; returns a {key: value} dict (or None) per item
+    items = [(cpv, keys, installed) for cpv, keys in items]
+    if len(items) < 2:
+        return list(map(_read_settings, items))
+
+    with ThreadPoolExecutor(SCAN_THREADS) as pool:
+        return list(pool.map(_read_settings, items, chunksize=64))
+
+
+METADATA = MetadataCache()
+INSTALLED.listeners.append(METADATA.invalidate_packages)
+REPO_CACHE.listeners.append(METADATA.invalidate_packages)
+
+
+def prefetch(pkgs, keys, installed=True):
+
+    METADATA.prefetch(pkgs, keys, installed)
@@ -1,17 +1,69 @@
 from future_builtins import map, filter, zip
 
-from ..helper import debug, paren_reduce
-from ..dependency import DependencyTree
+from threading import Lock
+from weakref import WeakValueDictionary
+
+from ..helper import debug, error, DependencyStringError
+from ..dependency import parse_dependencies
 
 from . import _Package, system, flags
+from .atom import compile_criterion, split_cpv
+from .installed import INSTALLED
+from .metadata import METADATA, PACKAGE, GLOBAL
+from .repo_cache import REPO_CACHE
+from .use_state import UNIVERSE, use_state
+
+
+_registry = WeakValueDictionary()  # (class, cpv) -> Package
+_registry_lock = Lock()
+
+
+def _forget_slots(cpvs):
+
+    # a remerge or sync may change the SLOT of an interned package
+    cpvs = set(cpvs)
+    with _registry_lock:
+        for (cls, cpv), pkg in list(_registry.items()):
+            if cpv in cpvs:
+                pkg._slot = None
+
+
+INSTALLED.listeners.append(_forget_slots)
+REPO_CACHE.listeners.append(_forget_slots)
 
 
 class Package(_Package):
+
+    __slots__ = ("_cpv", "_slot", "_cp", "_category", "_name", "_version") + (
+        () if hasattr(_Package, "__weakref__") else ("__weakref__",)
+    )
+
+    def __new__(cls, cpv):
+
+        with _registry_lock:
+            pkg = _registry.get((cls, cpv))
+            if pkg is None:
+                pkg = _Package.__new__(cls)
+                pkg._cpv = None
+                _registry[(cls, cpv)] = pkg
+
+            return pkg
+
     def __init__(self, cpv):
 
+        if self._cpv is not None:  # interned instance, already set up
+            return
+
         self._cpv = cpv
         self._slot = None
 
+        split = split_cpv(cpv)
+        if split is not None:
+            self._category, self._name, self._version = split
+            self._cp = "/".join((self._category, self._name))
+        else:
+            self._category = self._name = self._version = self._cp = None
+
     def __repr__(self):
         return "<Package '%s' @0x%x>" % (self._cpv, id(self))
 
@@ -43,26 +95,11 @@ class Package(_Package):
 
     def get_actual_use_flags(self):
 
-        i_flags = self.get_global_settings("USE", installed=False).split()
-        m_flags = system.get_global_settings("USE").split()
-        for f in self.get_new_use_flags():
-            removed = False
-
-            if f[0] == "~":
-                f = f[1:]
-                removed = True
-
-            invf = flags.invert_use_flag(f)
+        return UNIVERSE.names(use_state(self).effective)
 
-            if f[0] == "-":
-                if invf in i_flags and not (removed and invf in m_flags):
-                    i_flags.remove(invf)
+    def get_use_state(self):
 
-            elif f not in i_flags:
-                if not (removed and invf in m_flags):
-                    i_flags.append(f)
-
-        return i_flags
+        return use_state(self)
 
     def set_use_flag(self, flag):
         flags.set_use_flag(self, flag)
@@ -76,7 +113,7 @@ class Package(_Package):
             if flag.startswith(suggest.lower()):
                 return suggest
 
-        for exp in self.get_global_settings("USE_EXPAND").split():
+        for exp in self.get_cached_global_settings("USE_EXPAND").split():
             lexp = exp.lower()
             if flag.startswith(lexp):
                 return exp
@@ -89,12 +126,15 @@ class Package(_Package):
 
     def get_cp(self):
 
-        return "/".join((self.get_category(), self.get_name()))
+        if self._cp is None:
+            return "/".join((self.get_category(), self.get_name()))
+
+        return self._cp
 
     def get_slot(self):
 
         if self._slot is None:
-            self._slot = self.get_package_settings("SLOT")
+            self._slot = self.get_cached_package_settings("SLOT")
 
         return self._slot
 
@@ -111,27 +151,56 @@ class Package(_Package):
 
     def get_dependencies(self):
 
-        deps = " ".join(
-            map(self.get_package_settings, ("RDEPEND", "PDEPEND", "DEPEND"))
-        )
-        deps = paren_reduce(deps)
+        keys = ("RDEPEND", "PDEPEND", "DEPEND")
+        METADATA.prefetch([self], keys)
+        deps = " ".join(map(self.get_cached_package_settings, keys))
+        try:
+            return parse_dependencies(deps)
+        except DependencyStringError as e:
+            error(_("Invalid dependency string of '%s': %s"), self.get_cpv(), e)
+            return parse_dependencies("")
+
+    def get_missing_dependencies(self, installed=None):
+
+        if installed is None:
+            installed = INSTALLED
+
+        tree = self.get_dependencies()
+        use = set(self.get_actual_use_flags())
+        return list(tree.missing(tree.evaluate(installed, use), use))
+
+    def get_cached_package_settings(self, var, installed=True):
+
+        return METADATA.get(self, PACKAGE, var, installed)
+
+    def get_cached_global_settings(self, key, installed=True):
 
-        tree = DependencyTree()
-        tree.parse(deps)
+        return METADATA.get(self, GLOBAL, key, installed)
 
-        return tree
+    def get_package_settings_many(self, vars, installed=True):
+
+        return dict((v, self.get_package_settings(v, installed=installed)) for v in vars)
 
     def get_name(self):
 
-        raise NotImplementedError
+        if self._name is None:
+            raise NotImplementedError
+
+        return self._name
 
     def get_version(self):
 
-        raise NotImplementedError
+        if self._version is None:
+            raise NotImplementedError
+
+        return self._version
 
     def get_category(self):
 
-        raise NotImplementedError
+        if self._category is None:
+            raise NotImplementedError
+
+        return self._category
 
     def is_installed(self):
 
@@ -191,4 +260,8 @@ class Package(_Package):
 
     def matches(self, criterion):
 
-        raise NotImplementedError
+        try:
+            return compile_criterion(criterion).matches(self)
+        except ValueError:
+            debug("Cannot match %s against invalid criterion '%s'.", self._cpv, criterion)
+            return False
@@ -0,0 +1,199 @@
+from bisect import bisect_left, bisect_right
+from threading import Lock
+
+from .atom import compile_criterion, split_cpv_key
+
+INF = float("inf")
+
+
+def interval_of(c):
+
+    if c.version is None:
+        return (None, True, None, True)
+
+    key = c.key
+    op = c.op
+    if op == "=":
+        return (key, True, key, True)
+    elif op == "~":
+        return (key[:-1] + (0,), True, key[:-1] + (INF,), True)
+    elif op == ">=":
+        return (key, True, None, True)
+    elif op == ">":
+        return (key, False, None, True)
+    elif op == "<=":
+        return (None, True, key, True)
+    elif op == "<":
+        return (None, True, key, False)
+
+    return None
+
+
+def _covers_point(iv, p):
+
+    lo, lo_incl, hi, hi_incl = iv
+    return (lo is None or lo < p or (lo == p and lo_incl)) and (
+        hi is None or hi > p or (hi == p and hi_incl)
+    )
+
+
+def _covers_gap(iv, a, b):
+
+    lo, lo_incl, hi, hi_incl = iv
+    return (lo is None or (a is not None and lo <= a)) and (
+        hi is None or (b is not None and hi >= b)
+    )
+
+
+class VersionIntervals(object):
+
+    __slots__ = ("records", "points", "regions", "globs")
+
+    def __init__(self, records):
+
+        self.records = records
+        self.globs = []
+        intervals = []
+
+        for i, (file, line, crit, flags) in enumerate(records):
+            try:
+                c = compile_criterion(crit)
+            except ValueError:
+                continue
+
+            if c.is_blocker():
+                continue
+
+            iv = interval_of(c) if c.key is not None or c.version is None else None
+            if iv is None:
+                self.globs.append((i, c))
+            else:
+                intervals.append((i, c, iv))
+
+        points = set()
+        for i, c, iv in intervals:
+            if iv[0] is not None:
+                points.add(iv[0])
+            if iv[2] is not None:
+                points.add(iv[2])
+        self.points = sorted(points)
+
+        # elementary regions: (-inf, p0), [p0], (p0, p1), [p1], ..., [pn], (pn, inf)
+        self.regions = []
+        bounds = [None] + self.points + [None]
+        for n in range(len(bounds) - 1):
+            a, b = bounds[n], bounds[n + 1]
+            self.regions.append(
+                tuple((i, c) for i, c, iv in intervals if _covers_gap(iv, a, b))
+            )
+            if b is not None:
+                self.regions.append(
+                    tuple((i, c) for i, c, iv in intervals if _covers_point(iv, b))
+                )
+
+    def _region(self, key):
+
+        n = bisect_left(self.points, key)
+        if n < len(self.points) and self.points[n] == key:
+            return self.regions[2 * n + 1]
+        return self.regions[2 * n]
+
+    def query(self, pkg):
+
+        cp, version, key = split_cpv_key(pkg.get_cpv())
+        found = [
+            i for i, c in self._region(key)
+            if c.slot is None or c.match_slot(pkg.get_slot())
+        ]
+        found.extend(i for i, c in self.globs if c.matches(pkg))
+
+        return [self.records[i] for i in sorted(found)]
+
+    def affected(self, pkgs):
+
+        pkgs = sorted(pkgs, key=lambda p: split_cpv_key(p.get_cpv())[2])
+        keys = [split_cpv_key(p.get_cpv())[2] for p in pkgs]
+
+        result = []
+        for record in self.records:
+            try:
+                c = compile_criterion(record[2])
+            except ValueError:
+                result.append((record, []))
+                continue
+
+            iv = interval_of(c) if c.key is not None or c.version is None else None
+            if iv is None or c.is_blocker():
+                result.append((record, [p for p in pkgs if c.matches(p)]))
+                continue
+
+            lo, lo_incl, hi, hi_incl = iv
+            start = 0 if lo is None else (bisect_left if lo_incl else bisect_right)(keys, lo)
+            end = len(keys) if hi is None else (bisect_right if hi_incl else bisect_left)(keys, hi)
+
+            result.append((record, [
+                p for p in pkgs[start:end]
+                if c.slot is None or c.match_slot(p.get_slot())
+            ]))
+
+        return result
+
+
+class RangeIndex(object):
+    def __init__(self, index):
+
+        self.index = index
+        self._lock = Lock()
+        self._cache = {}
+
+    def intervals(self, cp, root):
+
+        gen = self.index.generation(root)
+        with self._lock:
+            cached = self._cache.get((root, cp))
+            if cached is not None and cached[0] == gen:
+                return cached[1]
+
+        vi = VersionIntervals(self.index.lookup(cp, root))
+        with self._lock:
+            self._cache[(root, cp)] = (gen, vi)
+
+        return vi
+
+    def query_many(self, pkgs, root):
+
+        gen = self.index.generation(root)
+        with self._lock:
+            missing = set(
+                p.get_cp() for p in pkgs
+                if self._cache.get((root, p.get_cp()), (None,))[0] != gen
+            )
+
+        if missing:
+            built = dict(
+                (cp, (gen, VersionIntervals(records)))
+                for cp, records in self.index.lookup_many(missing, root).items()
+            )
+            with self._lock:
+                self._cache.update(((root, cp), v) for cp, v in built.items())
+
+        with self._lock:
+            return [self._cache[(root, p.get_cp())][1].query(p) for p in pkgs]
+
+    def query(self, pkg, root):
+
+        return self.intervals(pkg.get_cp(), root).query(pkg)
+
+    def affected(self, cp, root, pkgs):
+
+        return self.intervals(cp, root).affected(pkgs)
+
+    def stale(self, root, packages_of):
+
+        stale = []
+        for cp in self.index.cps(root):
+            for record, pkgs in self.affected(cp, root, packages_of(cp)):
+                if not pkgs:
+                    stale.append(record)
+
+        return stale
@@ -0,0 +1,363 @@
+import os
+import mmap
+import struct
+import marshal
+from array import array
+from bisect import bisect_right
+from threading import RLock
+
+from ..constants import HOME, APP
+from ..helper import debug, warning
+from .atom import compile_criterion, split_cpv
+from .repository import (
+    REPO_FIELDS, MD5_CACHE, RepoEntry, read_cache_entry, repo_locations, repo_name,
+)
+
+INDEX_FILE = os.path.join(HOME, ".config", APP, "repository.idx")
+MAGIC = b"PRTOIDX\n"
+VERSION = 1
+
+# magic, version, records, cps, record offsets, search lines, search offsets, meta
+HEADER = struct.Struct("<8sIIIQQQQ")
+
+RECORD_FIELDS = ("cpv", "repo", "location", "md5") + tuple(f.lower() for f in REPO_FIELDS)
+
+
+def _record(e):
+
+    return "\0".join(getattr(e, f) or "" for f in RECORD_FIELDS).encode("utf-8")
+
+
+def _entry(data):
+
+    cpv, repo, location, md5, *values = data.decode("utf-8").split("\0")
+    values = dict(zip(REPO_FIELDS, values))
+    values["_md5_"] = md5
+    return RepoEntry(cpv, repo, values, location)
+
+
+def write_index(file, entries, meta):
+
+    # Layout: header | records | record offsets | search lines | search offsets | meta.
+    # Records are sorted by (cp, version); there is one search line per cp:
+    # "<lowercase cp>\0<lowercase description>\0<cp>\0<first record>\0<count>\n".
+    entries = sorted(entries, key=lambda e: (e.cp, e.key, e.repo))
+
+    out = bytearray(HEADER.size)
+    rec_offsets = array("Q")
+    for e in entries:
+        rec_offsets.append(len(out))
+        out += _record(e)
+    rec_offsets.append(len(out))
+
+    rec_offsets_pos = len(out)
+    out += rec_offsets.tobytes()
+
+    search_pos = len(out)
+    search_offsets = array("Q")
+    first = 0
+    while first < len(entries):
+        cp = entries[first].cp
+        last = first
+        while last + 1 < len(entries) and entries[last + 1].cp == cp:
+            last += 1
+
+        best = max(entries[first:last + 1], key=lambda e: e.key)
+        search_offsets.append(len(out))
+        out += "\0".join((
+            cp.lower(), best.description.lower().replace("\n", " "), cp,
+            str(first), str(last - first + 1),
+        )).encode("utf-8") + b"\n"
+        first = last + 1
+    search_offsets.append(len(out))
+
+    search_offsets_pos = len(out)
+    out += search_offsets.tobytes()
+
+    meta_pos = len(out)
+    out += marshal.dumps(meta)
+
+    HEADER.pack_into(
+        out, 0, MAGIC, VERSION, len(entries), len(search_offsets) - 1,
+        rec_offsets_pos, search_pos, search_offsets_pos, meta_pos,
+    )
+
+    dir = os.path.dirname(file)
+    if not os.path.isdir(dir):
+        os.makedirs(dir)
+
+    tmp = file + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(out)
+    os.replace(tmp, file)
+
+
+class _Mapping(object):
+
+    __slots__ = ("mm", "records", "cps", "rec_offsets", "search_pos", "search_end", "search_offsets", "meta_pos")
+
+    def __init__(self, file):
+
+        with open(file, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, self.records, self.cps, rec_offsets_pos, self.search_pos, \
+            search_offsets_pos, self.meta_pos = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Unknown repository index format")
+
+        view = memoryview(self.mm)
+        self.rec_offsets = view[rec_offsets_pos:rec_offsets_pos + 8 * (self.records + 1)].cast("Q")
+        self.search_offsets = view[search_offsets_pos:search_offsets_pos + 8 * (self.cps + 1)].cast("Q")
+        self.search_end = self.search_offsets[self.cps]
+
+    def record(self, i):
+
+        return _entry(self.mm[self.rec_offsets[i]:self.rec_offsets[i + 1]])
+
+    def line(self, i):
+
+        return self.mm[self.search_offsets[i]:self.search_offsets[i + 1] - 1].decode("utf-8").split("\0")
+
+    def meta(self):
+
+        return marshal.loads(self.mm[self.meta_pos:])
+
+
+class RepoCache(object):
+    def __init__(self, file=INDEX_FILE, locations=None):
+
+        self.file = file
+        self.locations = locations
+        self._lock = RLock()
+        self._map = None
+        self.listeners = []  # called with the added, removed and changed cpvs
+
+    def open(self):
+
+        # maps the index in; nothing is parsed until it is queried
+        with self._lock:
+            try:
+                self._map = _Mapping(self.file)
+            except (OSError, ValueError, struct.error) as e:
+                debug("No usable repository index at '%s': %s", self.file, e)
+                self._map = None
+
+            return self._map is not None
+
+    def is_open(self):
+
+        return self._map is not None
+
+    def _mapping(self):
+
+        # never builds the index: that is update()'s job, run it explicitly
+        # (e.g. from a background thread) when open() fails
+        with self._lock:
+            if self._map is None:
+                self.open()
+            return self._map
+
+    def is_available(self):
+
+        m = self._mapping()
+        return m is not None and m.cps > 0
+
+    def _categories(self):
+
+        locations = self.locations if self.locations is not None else repo_locations()
+        found = {}
+        for loc in locations:
+            repo = repo_name(loc)
+            cache = os.path.join(loc, MD5_CACHE)
+            for cat in sorted(os.listdir(cache)):
+                cpath = os.path.join(cache, cat)
+                if cat.startswith(".") or not os.path.isdir(cpath):
+                    continue
+                found[(loc, cat)] = (repo, cpath, os.stat(cpath).st_mtime_ns)
+
+        return found
+
+    def update(self, full=False):
+
+        # rescans md5-cache categories whose mtime changed (all of them if
+        # full) and rereads entries whose file changed; returns the added,
+        # removed and changed (by _md5_) cpvs
+        with self._lock:
+            old = self._map
+            meta = old.meta() if old is not None else {"categories": {}, "files": {}}
+            found = self._categories()
+            categories = dict((k, v[2]) for k, v in found.items())
+
+            if old is not None and not full and categories == meta["categories"]:
+                return [], [], []
+
+            old_entries = {}
+            if old is not None:
+                for i in range(old.records):
+                    e = old.record(i)
+                    old_entries[(e.location, e.cpv)] = e
+
+            files = {}
+            entries = {}
+            added, changed = [], []
+
+            for (loc, cat), (repo, cpath, mtime) in found.items():
+                old_files = meta["files"].get((loc, cat), {})
+                if not full and meta["categories"].get((loc, cat)) == mtime:
+                    for cpv, stamp in old_files.items():
+                        if (loc, cpv) in old_entries:
+                            files.setdefault((loc, cat), {})[cpv] = stamp
+                            entries[(loc, cpv)] = old_entries[(loc, cpv)]
+                    continue
+
+                for pf in os.listdir(cpath):
+                    cpv = "/".join((cat, pf))
+                    if pf.startswith(".") or split_cpv(cpv) is None:
+                        continue
+
+                    try:
+                        st = os.stat(os.path.join(cpath, pf))
+                    except OSError:
+                        continue
+
+                    stamp = (st.st_mtime_ns, st.st_size)
+                    prev = old_entries.get((loc, cpv))
+                    if prev is not None and old_files.get(cpv) == stamp:
+                        e = prev
+                    else:
+                        try:
+                            e = RepoEntry(cpv, repo, read_cache_entry(os.path.join(cpath, pf)), loc)
+                        except (IOError, OSError, ValueError) as err:
+                            debug("Skipping cache entry '%s': %s", cpv, err)
+                            continue
+
+                        if prev is None:
+                            added.append(cpv)
+                        elif prev.md5 != e.md5:
+                            changed.append(cpv)
+
+                    files.setdefault((loc, cat), {})[cpv] = stamp
+                    entries[(loc, cpv)] = e
+
+            removed = [cpv for (loc, cpv) in old_entries if (loc, cpv) not in entries]
+
+            try:
+                write_index(self.file, entries.values(), {"categories": categories, "files": files})
+            except (OSError, ValueError) as e:
+                warning(_("Could not save repository index to %(file)s: %(error)s"),
+                        {"file": self.file, "error": e})
+                return added, removed, changed
+
+            self.open()
+            for listener in self.listeners:
+                listener(added + removed + changed)
+            debug("Repository index updated: %d added, %d removed, %d changed.",
+                  len(added), len(removed), len(changed))
+            return added, removed, changed
+
+    def cps(self):
+
+        m = self._mapping()
+        if m is None:
+            return []
+        return [m.line(i)[2] for i in range(m.cps)]
+
+    def _find_cp(self, m, cp):
+
+        lo, hi = 0, m.cps
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if m.line(mid)[2] < cp:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < m.cps and m.line(lo)[2] == cp else None
+
+    def entries(self, cp):
+
+        m = self._mapping()
+        i = None if m is None else self._find_cp(m, cp)
+        if i is None:
+            return []
+
+        first, count = map(int, m.line(i)[3:5])
+        return sorted((m.record(r) for r in range(first, first + count)), key=lambda e: e.key)
+
+    def best(self, cp):
+
+        entries = self.entries(cp)
+        return entries[-1] if entries else None
+
+    def get(self, cpv):
+
+        split = split_cpv(cpv)
+        if split is None:
+            return None
+
+        for e in self.entries("/".join(split[:2])):
+            if e.cpv == cpv:
+                return e
+        return None
+
+    def match(self, atom, visible=None):
+
+        # best entry matching an atom; plain cps and cpvs are accepted, too.
+        # With a visible(entry) predicate the best visible entry is preferred,
+        # the best one overall is only returned if none is visible.
+        split = split_cpv(atom)
+        if split is not None and atom[0].isalnum():
+            return self.get(atom)
+
+        try:
+            c = compile_criterion(atom)
+        except ValueError:
+            return None
+
+        found = [
+            e for e in self.entries(c.cp)
+            if c.match_version(e.version, e.key) and (c.slot is None or c.match_slot(e.slot))
+        ]
+        if visible is not None:
+            for e in reversed(found):
+                if visible(e):
+                    return e
+        return found[-1] if found else None
+
+    def iter_search(self, text, descriptions=True):
+
+        # name hits first, then description hits; one (best) entry per cp.
+        # The search lines are scanned in place, only hits are decoded.
+        m = self._mapping()
+        if m is None:
+            return
+
+        needle = text.lower().replace("\0", "").replace("\n", "").encode("utf-8")
+        later = []
+        pos = m.search_pos
+        while needle:
+            i = m.mm.find(needle, pos, m.search_end)
+            if i < 0:
+                break
+
+            line = bisect_right(m.search_offsets, i) - 1
+            start = m.search_offsets[line]
+            sep = m.mm.find(b"\0", start)
+            if i + len(needle) <= sep:
+                yield self.best(m.line(line)[2])
+            elif descriptions and i > sep and i + len(needle) <= m.mm.find(b"\0", sep + 1):
+                later.append(line)
+            pos = m.search_offsets[line + 1]
+
+        if not needle:
+            later = range(m.cps)
+
+        for line in later:
+            yield self.best(m.line(line)[2])
+
+    def search(self, text, descriptions=True):
+
+        return list(self.iter_search(text, descriptions))
+
+
+REPO_CACHE = RepoCache()
@@ -0,0 +1,95 @@
+import os
+import io
+from configparser import ConfigParser, Error as ConfigParserError
+
+from ..helper import warning
+from .atom import split_cpv, version_key
+
+REPOS_CONF = "/etc/portage/repos.conf"
+DEFAULT_REPOS = ("/var/db/repos/gentoo", "/usr/portage")
+
+MD5_CACHE = os.path.join("metadata", "md5-cache")
+
+# md5-cache keys kept per entry
+REPO_FIELDS = ("DESCRIPTION", "HOMEPAGE", "LICENSE", "KEYWORDS", "IUSE", "SLOT")
+
+
+def repo_locations(conf=REPOS_CONF):
+
+    if os.path.isdir(conf):
+        files = sorted(
+            os.path.join(conf, f) for f in os.listdir(conf)
+            if not f.startswith(".") and not f.endswith("~")
+        )
+    else:
+        files = [conf]
+
+    parser = ConfigParser(interpolation=None)
+    try:
+        parser.read(files)
+    except ConfigParserError as e:
+        warning(_("Could not parse %(file)s: %(error)s"), {"file": conf, "error": e})
+
+    locations = []
+    for section in parser.sections():
+        loc = parser.get(section, "location", fallback=None)
+        if loc and loc not in locations:
+            locations.append(loc)
+
+    if not locations:
+        locations = [d for d in DEFAULT_REPOS if os.path.isdir(d)][:1]
+
+    return [loc for loc in locations if os.path.isdir(os.path.join(loc, MD5_CACHE))]
+
+
+def repo_name(location):
+
+    try:
+        with io.open(os.path.join(location, "profiles", "repo_name"), encoding="utf-8") as f:
+            return f.readline().strip() or os.path.basename(location)
+    except (IOError, OSError):
+        return os.path.basename(location)
+
+
+def read_cache_entry(path):
+
+    values = {}
+    with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+        for line in f:
+            key, sep, value = line.rstrip("\n").partition("=")
+            if sep:
+                values[key] = value
+
+    return values
+
+
+class RepoEntry(object):
+
+    __slots__ = ("cpv", "cp", "version", "key", "repo", "location", "md5") + tuple(
+        f.lower() for f in REPO_FIELDS
+    )
+
+    def __init__(self, cpv, repo, values, location=None):
+
+        cat, name, self.version = split_cpv(cpv)
+        self.cpv = cpv
+        self.cp = "/".join((cat, name))
+        self.key = version_key(self.version)
+        self.repo = repo
+        self.location = location
+        self.md5 = values.get("_md5_", "")
+        for f in REPO_FIELDS:
+            setattr(self, f.lower(), values.get(f, ""))
+
+    def __lt__(self, b):
+        return self.key < b.key
+
+    def __repr__(self):
+        return "<RepoEntry '%s::%s'>" % (self.cpv, self.repo)
+
+    def read(self):
+
+        # the complete md5-cache entry, e.g. for the *DEPEND keys
+        if self.location is None:
+            return {}
+        return read_cache_entry(os.path.join(self.location, MD5_CACHE, self.cpv))
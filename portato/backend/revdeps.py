@@ -0,0 +1,164 @@
+import os
+import marshal
+from threading import RLock
+
+from ..constants import SESSION_DIR
+from ..helper import debug, warning, DependencyStringError
+from ..dependency import parse_dependencies
+from .atom import compile_criterion
+from .config_index import split_criterion, stamp_of
+from .installed import INSTALLED
+
+REVDEP_FILE = os.path.join(SESSION_DIR, "revdeps")
+VERSION = 1
+
+REVDEP_KEYS = ("RDEPEND", "PDEPEND")
+
+
+def active_atoms(tree, use):
+
+    # all atoms a package may pull in under its USE, including every
+    # alternative of a || group; blockers are left out
+    seen = set()
+    todo = [tree]
+    while todo:
+        node = todo.pop()
+        if node in seen:
+            continue
+        seen.add(node)
+
+        for d in node.deps:
+            if not d.dep.startswith("!"):
+                yield d.dep
+        todo.extend(node.active_flags(use))
+        todo.extend(node.ors)
+        todo.extend(node.subs)
+
+
+def read_atoms(pkg):
+
+    deps = " ".join(pkg.get(k) for k in REVDEP_KEYS)
+    try:
+        tree = parse_dependencies(deps)
+    except DependencyStringError as e:
+        warning(_("Invalid dependency string of installed '%s': %s"), pkg.cpv, e)
+        return ()
+
+    return tuple(sorted(set(active_atoms(tree, set(pkg.get("USE").split())))))
+
+
+class RevdepIndex(object):
+    def __init__(self, installed=INSTALLED, file=REVDEP_FILE):
+
+        self.installed = installed
+        self.file = file
+        self._lock = RLock()
+        self._entries = {}  # cpv -> (stamp, atoms)
+        self._by_cp = None  # cp -> [(cpv, atom)]
+        self._loaded = False
+
+    def load(self):
+
+        try:
+            with open(self.file, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            debug("No usable reverse dependency cache at '%s'.", self.file)
+            data = None
+
+        with self._lock:
+            if data is not None and data.get("version") == VERSION and data.get("vdb") == self.installed.path:
+                self._entries = data["entries"]
+            self._by_cp = None
+            self._loaded = True
+
+        return self
+
+    def save(self):
+
+        with self._lock:
+            data = {"version": VERSION, "vdb": self.installed.path, "entries": self._entries}
+
+        try:
+            if not os.path.isdir(os.path.dirname(self.file)):
+                os.makedirs(os.path.dirname(self.file))
+
+            tmp = self.file + ".tmp"
+            with open(tmp, "wb") as f:
+                marshal.dump(data, f)
+            os.replace(tmp, self.file)
+        except (OSError, ValueError) as e:
+            warning(_("Could not save reverse dependency cache to %(file)s: %(error)s"),
+                    {"file": self.file, "error": e})
+
+    def refresh(self):
+
+        with self._lock:
+            if not self.installed.refresh() and self._loaded and self._by_cp is not None:
+                return False
+
+            if not self._loaded:
+                self.load()
+
+            current = {}
+            for pkg in self.installed.packages():
+                try:
+                    current[pkg.cpv] = (pkg, stamp_of(os.stat(pkg.path)))
+                except OSError:
+                    continue
+
+            changed = False
+            for cpv in set(self._entries) - set(current):
+                del self._entries[cpv]
+                changed = True
+
+            for cpv, (pkg, stamp) in current.items():
+                entry = self._entries.get(cpv)
+                if entry is None or entry[0] != stamp:
+                    self._entries[cpv] = (stamp, read_atoms(pkg))
+                    changed = True
+
+            if changed or self._by_cp is None:
+                by_cp = {}
+                for cpv, (stamp, atoms) in self._entries.items():
+                    for atom in atoms:
+                        split = split_criterion(atom)
+                        if split is not None:
+                            by_cp.setdefault(split[0], []).append((cpv, atom))
+                self._by_cp = by_cp
+
+            if changed:
+                debug("Reverse dependency index updated: %d installed packages.", len(self._entries))
+                self.save()
+
+            return changed
+
+    def rdepends(self, atom):
+
+        self.refresh()
+
+        split = split_criterion(atom)
+        if split is not None and split[1] is not None and atom[0].isalnum():
+            atom = "=" + atom  # plain cpv
+
+        targets = self.installed.match(atom)
+        result = set()
+        for target in targets:
+            for cpv, dep in self._by_cp.get(target.cp, ()):
+                if cpv == target.cpv:
+                    continue
+
+                try:
+                    c = compile_criterion(dep)
+                except ValueError:
+                    continue
+
+                if c.match_version(target.version, target.key) and (
+                    c.slot is None or c.match_slot(target.slot)
+                ):
+                    result.add((cpv, dep))
+
+        return sorted(result)
+
+
+REVDEPS = RevdepIndex()
@@ -0,0 +1,166 @@
+import os
+import io
+import re
+import marshal
+
+from ..constants import SESSION_DIR
+from ..helper import debug, warning
+from .config_index import ConfigFile, stamp_of
+
+SNAPSHOT_FILE = os.path.join(SESSION_DIR, "config.snapshot")
+VERSION = 1
+
+ASSIGNMENT = re.compile(r"^\s*(?:export\s+)?(?P<key>[A-Za-z_][A-Za-z0-9_]*)=(?P<value>.*)$")
+
+
+def parse_make_conf(lines):
+
+    values = {}
+    it = iter(lines)
+    for line in it:
+        m = ASSIGNMENT.match(line)
+        if m is None:
+            continue
+
+        key, value = m.group("key"), m.group("value").strip()
+        if value[:1] in ("'", '"'):
+            quote = value[0]
+            value = value[1:]
+            while quote not in value:
+                try:
+                    value += " " + next(it).strip()
+                except StopIteration:
+                    break
+            value = value.split(quote, 1)[0]
+        else:
+            value = value.split("#", 1)[0].strip()
+
+        values[key] = " ".join(value.split())
+
+    return values
+
+
+def _stat(path, follow=True):
+
+    try:
+        return stamp_of(os.stat(path) if follow else os.lstat(path))
+    except OSError:
+        return None
+
+
+class ConfigSnapshot(object):
+    def __init__(self, config_path, file=SNAPSHOT_FILE):
+
+        self.config_path = config_path
+        self.file = file
+        self._files = {}
+        self._make_conf = {}
+        self._profile = None
+
+    def make_conf_paths(self):
+
+        paths = [os.path.join(self.config_path, "make.conf")]
+        d = os.path.join(self.config_path, "make.conf.d")
+        if os.path.isdir(d):
+            for fn in sorted(os.listdir(d)):
+                if fn.endswith(".conf"):
+                    paths.append(os.path.join(d, fn))
+        return paths
+
+    def profile_path(self):
+
+        return os.path.join(self.config_path, "make.profile")
+
+    def load(self):
+
+        try:
+            with open(self.file, "rb") as f:
+                data = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            debug("No usable config snapshot at '%s'.", self.file)
+            return self
+
+        if data.get("version") != VERSION or data.get("config_path") != self.config_path:
+            debug("Ignoring config snapshot '%s' of another version or root.", self.file)
+            return self
+
+        kept = 0
+        for path, (stamp, lines, entries) in data["files"].items():
+            if _stat(path) == stamp:
+                self._files[path] = ConfigFile(path, stamp, lines, entries)
+                kept += 1
+
+        for path, (stamp, values) in data["make_conf"].items():
+            if _stat(path) == stamp:
+                self._make_conf[path] = (stamp, values)
+
+        profile = data["profile"]
+        if profile is not None and _stat(self.profile_path(), follow=False) == profile[0]:
+            self._profile = profile
+
+        debug("Config snapshot: %d of %d files unchanged.", kept, len(data["files"]))
+        return self
+
+    def restore(self, index):
+
+        for cf in self._files.values():
+            index.adopt(cf)
+
+    def make_conf(self):
+
+        merged = {}
+        for path in self.make_conf_paths():
+            stamp = _stat(path)
+            if stamp is None:
+                continue
+
+            cached = self._make_conf.get(path)
+            if cached is None or cached[0] != stamp:
+                with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+                    cached = self._make_conf[path] = (stamp, parse_make_conf(f))
+
+            merged.update(cached[1])
+
+        return merged
+
+    def profile(self):
+
+        path = self.profile_path()
+        stamp = _stat(path, follow=False)
+        if stamp is None:
+            return None
+
+        if self._profile is None or self._profile[0] != stamp:
+            self._profile = (stamp, os.readlink(path) if os.path.islink(path) else path)
+
+        return self._profile[1]
+
+    def save(self, index=None):
+
+        if index is not None:
+            self._files = dict((cf.path, cf) for cf in index.files())
+
+        self.make_conf()
+        self.profile()
+
+        data = {
+            "version": VERSION,
+            "config_path": self.config_path,
+            "files": dict(
+                (cf.path, (cf.stamp, cf.lines, cf.entries)) for cf in self._files.values()
+            ),
+            "make_conf": self._make_conf,
+            "profile": self._profile,
+        }
+
+        try:
+            if not os.path.isdir(os.path.dirname(self.file)):
+                os.makedirs(os.path.dirname(self.file))
+
+            tmp = self.file + ".tmp"
+            with open(tmp, "wb") as f:
+                marshal.dump(data, f)
+            os.replace(tmp, self.file)
+        except (OSError, ValueError) as e:
+            warning(_("Could not save config snapshot to %(file)s: %(error)s"),
+                    {"file": self.file, "error": e})
@@ -0,0 +1,149 @@
+import os
+import io
+import difflib
+import tempfile
+
+from ..helper import debug
+from .config_index import stamp_of
+
+
+class StaleFileError(IOError):
+
+    # a config file was changed by someone else after changes were staged
+    pass
+
+
+class Transaction(object):
+    def __init__(self):
+
+        self._edits = {}
+        self._appends = {}
+
+    def edit(self, file, line, fn):
+
+        self._edits.setdefault(file, {}).setdefault(int(line), []).append(fn)
+
+    def append(self, file, text):
+
+        self._appends.setdefault(file, []).append(text)
+
+    def files(self):
+
+        files = list(self._edits.keys())
+        files.extend(f for f in self._appends if f not in self._edits)
+        return files
+
+    def is_empty(self):
+
+        return not (self._edits or self._appends)
+
+    def render(self, file, lines):
+
+        edits = self._edits.get(file, {})
+        for no, line in enumerate(lines, 1):
+            for fn in edits.get(no, ()):
+                line = fn(line)
+            yield line
+
+        for text in self._appends.get(file, ()):
+            yield text
+
+    def diff(self, file, lines):
+
+        lines = list(lines)
+        new = "".join(self.render(file, lines)).splitlines(True)
+        return "".join(difflib.unified_diff(lines, new, file, file + " (portato)"))
+
+    def _prepare(self, file, expected):
+
+        # renders file into a temporary file next to it; returns its path
+        dir = os.path.dirname(file)
+        if dir and not os.path.isdir(dir):
+            os.makedirs(dir)
+
+        try:
+            st = os.stat(file)
+        except OSError:
+            st = None
+
+        if expected is not None and (st is None or stamp_of(st) != expected):
+            raise StaleFileError("%s changed since the changes were staged" % file)
+
+        fd, tmp = tempfile.mkstemp(dir=dir or ".", prefix="." + os.path.basename(file) + ".")
+        try:
+            # bytes that are not UTF-8 survive the round trip unchanged
+            with io.open(fd, "w", encoding="utf-8", errors="surrogateescape") as out:
+                if st is None:
+                    out.writelines(self.render(file, ()))
+                else:
+                    with io.open(file, "r", encoding="utf-8", errors="surrogateescape") as f:
+                        out.writelines(self.render(file, f))
+                out.flush()
+                os.fsync(out.fileno())
+
+            if st is not None:
+                os.chmod(tmp, st.st_mode & 0o7777)
+                try:
+                    os.chown(tmp, st.st_uid, st.st_gid)
+                except OSError:
+                    pass
+            else:
+                os.chmod(tmp, 0o644)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+
+        return tmp
+
+    def commit(self, index=None):
+
+        # all or nothing: every file is rendered to a temporary file first,
+        # files with edits must still have the stamp 'index' parsed them
+        # with; only then are they all moved into place
+        files = self.files()
+        prepared = []
+        try:
+            for file in files:
+                expected = None
+                if index is not None and file in self._edits:
+                    cf = index.get_file(file, check=False)
+                    if cf is not None:
+                        expected = cf.stamp
+
+                prepared.append((file, self._prepare(file, expected), expected))
+
+            for file, tmp, expected in prepared:
+                if expected is not None and _stamp(file) != expected:
+                    raise StaleFileError("%s changed since the changes were staged" % file)
+
+            for file, tmp, expected in prepared:
+                debug("Writing config file '%s'.", file)
+                os.replace(tmp, file)
+        except BaseException:
+            for file, tmp, expected in prepared:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+            raise
+
+        self._edits = {}
+        self._appends = {}
+        return files
+
+
+def _stamp(file):
+
+    try:
+        return stamp_of(os.stat(file))
+    except OSError:
+        return None
+
+
+def diff_files(trans, index, check=True):
+
+    # unified diffs of all files touched by trans, against their parsed state
+    diffs = []
+    for file in trans.files():
+        cf = index.get_file(file, check=check)
+        diffs.append(trans.diff(file, cf.lines if cf is not None else ()))
+
+    return "".join(diffs)
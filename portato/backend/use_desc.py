@@ -0,0 +1,133 @@
+import os
+import io
+from threading import RLock
+from xml.etree import ElementTree
+
+from ..helper import debug
+from .repository import repo_locations
+
+METADATA_XML = "metadata.xml"
+
+
+def read_desc(path):
+
+    # "<key> - <description>" lines of use.desc and friends
+    found = {}
+    try:
+        with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                line = line.strip()
+                if not line or line.startswith("#"):
+                    continue
+
+                key, sep, desc = line.partition(" - ")
+                if sep:
+                    found[key.strip()] = desc.strip()
+    except (IOError, OSError):
+        pass
+
+    return found
+
+
+def read_metadata_xml(path):
+
+    try:
+        root = ElementTree.parse(path).getroot()
+    except (IOError, OSError, ElementTree.ParseError):
+        return {}
+
+    found = {}
+    for use in root.iter("use"):
+        if use.get("lang", "en") != "en":
+            continue
+        for flag in use.iter("flag"):
+            name = flag.get("name")
+            if name:
+                found[name] = " ".join("".join(flag.itertext()).split())
+
+    return found
+
+
+class FlagDescriptions(object):
+    def __init__(self, locations=None):
+
+        self.locations = locations
+        self._lock = RLock()
+        self._global = None  # flag -> description (use.desc and profiles/desc/*.desc)
+        self._local = None  # cp -> {flag: description} (use.local.desc)
+        self._xml = {}  # cp -> {flag: description} (metadata.xml)
+
+    def _locations(self):
+
+        return self.locations if self.locations is not None else repo_locations()
+
+    def load(self):
+
+        glob, local = {}, {}
+        for loc in reversed(self._locations()):  # the first repository wins
+            profiles = os.path.join(loc, "profiles")
+            glob.update(read_desc(os.path.join(profiles, "use.desc")))
+
+            expand = os.path.join(profiles, "desc")
+            if os.path.isdir(expand):
+                for fn in sorted(os.listdir(expand)):
+                    if fn.endswith(".desc"):
+                        prefix = fn[:-len(".desc")]
+                        for value, desc in read_desc(os.path.join(expand, fn)).items():
+                            glob["%s_%s" % (prefix, value)] = desc
+
+            for key, desc in read_desc(os.path.join(profiles, "use.local.desc")).items():
+                cp, sep, flag = key.partition(":")
+                if sep:
+                    local.setdefault(cp, {})[flag] = desc
+
+        with self._lock:
+            self._global = glob
+            self._local = local
+            self._xml = {}
+
+        debug("Flag descriptions: %d global, %d packages with local flags.", len(glob), len(local))
+        return self
+
+    def invalidate(self):
+
+        with self._lock:
+            self._global = None
+            self._xml = {}
+
+    def _metadata(self, cp):
+
+        with self._lock:
+            found = self._xml.get(cp)
+        if found is not None:
+            return found
+
+        found = {}
+        for loc in reversed(self._locations()):
+            found.update(read_metadata_xml(os.path.join(loc, cp, METADATA_XML)))
+
+        with self._lock:
+            self._xml[cp] = found
+        return found
+
+    def describe(self, cp, flag):
+
+        # metadata.xml beats use.local.desc beats the global descriptions
+        with self._lock:
+            if self._global is None:
+                self.load()
+            glob, local = self._global, self._local
+
+        desc = self._metadata(cp).get(flag)
+        if desc is None:
+            desc = local.get(cp, {}).get(flag)
+        if desc is None:
+            desc = glob.get(flag, "")
+        return desc
+
+    def describe_all(self, cp, flags):
+
+        return dict((f, self.describe(cp, f)) for f in flags)
+
+
+DESCRIPTIONS = FlagDescriptions()
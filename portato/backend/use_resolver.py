@@ -0,0 +1,223 @@
+import os
+import io
+from threading import RLock
+
+from ..helper import debug
+from .atom import compile_criterion, split_cpv_key
+from .config_index import INDEX
+from .snapshot import ConfigSnapshot, parse_make_conf
+
+CONFIG_PATH = "/etc/portage"
+
+
+def read_raw(path):
+
+    try:
+        with io.open(path, "r", encoding="utf-8", errors="replace") as f:
+            return f.readlines()
+    except (IOError, OSError):
+        return []
+
+
+def read_lines(path):
+
+    lines = read_raw(path)
+    return [l.split("#", 1)[0].split() for l in lines if l.split("#", 1)[0].strip()]
+
+
+def profile_stack(profile):
+
+    # profile directories, parents first, as given by the 'parent' files
+    stack = []
+
+    def walk(path):
+        path = os.path.realpath(path)
+        for line in read_lines(os.path.join(path, "parent")):
+            walk(os.path.join(path, line[0]))
+        if path not in stack:
+            stack.append(path)
+
+    if profile is not None and os.path.isdir(profile):
+        walk(profile)
+    return stack
+
+
+def apply_tokens(enabled, tokens):
+
+    # incremental stacking: '-*' resets, '-prefix_*' drops all flags with
+    # that prefix (a USE_EXPAND reset), '-flag' disables, 'flag' enables
+    for t in tokens:
+        if t == "-*":
+            enabled.clear()
+        elif t[0] == "-" and t.endswith("_*"):
+            for f in [f for f in enabled if f.startswith(t[1:-1])]:
+                enabled.discard(f)
+        elif t[0] == "-":
+            enabled.discard(t[1:])
+        else:
+            enabled.add(t.lstrip("+"))
+
+
+def tokens_of(values, var):
+
+    # the tokens of an incremental variable, without ${VAR} references
+    return [t for t in values.get(var, "").split() if not t.startswith("$")]
+
+
+class _Profile(object):
+
+    __slots__ = ("dirs", "defaults", "conf", "force", "mask", "arch", "keywords")
+
+    def __init__(self, dirs, make_conf):
+
+        self.dirs = dirs
+        layers = [parse_make_conf(read_raw(os.path.join(d, "make.defaults"))) for d in dirs] + [make_conf]
+
+        # ACCEPT_KEYWORDS and USE_EXPAND stack incrementally like USE
+        self.keywords = set()
+        use_expand = set()
+        for values in layers:
+            apply_tokens(self.keywords, tokens_of(values, "ACCEPT_KEYWORDS"))
+            apply_tokens(use_expand, tokens_of(values, "USE_EXPAND"))
+
+        # USE tokens of every make.defaults (in the order of dirs) and of
+        # make.conf; each layer's USE_EXPAND variables come first, as prefixed
+        # tokens: VIDEO_CARDS="-* intel" -> -video_cards_* video_cards_intel
+        tokens = []
+        for values in layers:
+            layer = []
+            for var in sorted(use_expand):
+                prefix = var.lower() + "_"
+                for t in tokens_of(values, var):
+                    if t[0] == "-":
+                        layer.append("-" + prefix + t[1:])
+                    else:
+                        layer.append(prefix + t)
+            tokens.append(layer + tokens_of(values, "USE"))
+
+        self.defaults = tokens[:-1]
+        self.conf = tokens[-1]
+
+        self.arch = None
+        for values in layers:
+            self.arch = values.get("ARCH", self.arch)
+        if not self.keywords and self.arch:
+            self.keywords.add(self.arch)
+
+        self.force = set()
+        self.mask = set()
+        for d in dirs:
+            for line in read_lines(os.path.join(d, "use.force")):
+                apply_tokens(self.force, line)
+            for line in read_lines(os.path.join(d, "use.mask")):
+                apply_tokens(self.mask, line)
+
+
+class UseResolver(object):
+    def __init__(self, config_path=CONFIG_PATH, index=None):
+
+        self.config_path = config_path
+        self.index = index if index is not None else INDEX
+        self.snapshot = ConfigSnapshot(config_path)
+        self._lock = RLock()
+        self._profile = None
+        self._key = None
+
+    def invalidate(self):
+
+        with self._lock:
+            self._profile = None
+
+    def profile(self):
+
+        # the stacked profile plus make.conf; rebuilt when either changes
+        with self._lock:
+            make_conf = self.snapshot.make_conf()
+            target = self.snapshot.profile()
+            key = (target, sorted(make_conf.items()))
+            if self._profile is None or key != self._key:
+                if target is not None and not os.path.isabs(target):
+                    target = os.path.join(self.config_path, target)
+                debug("Stacking profile '%s'.", target)
+                self._profile = _Profile(profile_stack(target), make_conf)
+                self._key = key
+            return self._profile
+
+    def _package_layers(self, root, cp, version, key, slot):
+
+        for path, line, crit, flags in self.index.lookup(cp, root):
+            try:
+                c = compile_criterion(crit)
+            except ValueError:
+                continue
+
+            if c.match_version(version, key) and (c.slot is None or c.match_slot(slot)):
+                yield flags
+
+    def accepted_keywords(self, cpv, slot="0"):
+
+        # ACCEPT_KEYWORDS plus matching package.accept_keywords (and legacy
+        # package.keywords) lines; a line without keywords accepts ~ARCH
+        cp, version, key = split_cpv_key(cpv)
+        p = self.profile()
+
+        accepted = set(p.keywords)
+        for name in ("package.keywords", "package.accept_keywords"):
+            for flags in self._package_layers(os.path.join(self.config_path, name), cp, version, key, slot):
+                if flags:
+                    apply_tokens(accepted, flags)
+                elif p.arch:
+                    accepted.add("~" + p.arch)
+        return accepted
+
+    def is_visible(self, entry):
+
+        # whether the KEYWORDS of a repository entry are accepted
+        keywords = entry.keywords.split()
+        accepted = self.accepted_keywords(entry.cpv, entry.slot or "0")
+        if "**" in accepted:
+            return True
+
+        for k in keywords:
+            if k in accepted:
+                return True
+            if k[0] == "~" and "~*" in accepted:
+                return True
+            if k[0] not in "~-" and "*" in accepted:
+                return True
+        return False
+
+    def resolve(self, cpv, iuse, slot="0"):
+
+        # effective USE of cpv, lowest priority first: IUSE defaults; per
+        # profile its make.defaults and package.use; make.conf; the user's
+        # package.use. use.force/use.mask
+        # and their package.* variants win over all of them. Restricted to
+        # IUSE; returns (enabled, forced, masked).
+        cp, version, key = split_cpv_key(cpv)
+        p = self.profile()
+
+        enabled = set(f[1:] for f in iuse if f.startswith("+"))
+        for d, tokens in zip(p.dirs, p.defaults):
+            apply_tokens(enabled, tokens)
+            for flags in self._package_layers(os.path.join(d, "package.use"), cp, version, key, slot):
+                apply_tokens(enabled, flags)
+
+        apply_tokens(enabled, p.conf)
+        for flags in self._package_layers(os.path.join(self.config_path, "package.use"), cp, version, key, slot):
+            apply_tokens(enabled, flags)
+
+        forced = set(p.force)
+        masked = set(p.mask)
+        for d in p.dirs:
+            for flags in self._package_layers(os.path.join(d, "package.use.force"), cp, version, key, slot):
+                apply_tokens(forced, flags)
+            for flags in self._package_layers(os.path.join(d, "package.use.mask"), cp, version, key, slot):
+                apply_tokens(masked, flags)
+
+        names = set(f.lstrip("+-") for f in iuse)
+        enabled = (enabled | forced) - masked
+        return enabled & names, forced & names, masked & names
+
+
+RESOLVER = UseResolver()
@@ -0,0 +1,132 @@
+from threading import Lock
+
+
+class FlagUniverse(object):
+    def __init__(self):
+
+        self._bits = {}
+        self._names = []
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._names)
+
+    def bit(self, flag):
+
+        try:
+            return self._bits[flag]
+        except KeyError:
+            with self._lock:
+                if flag not in self._bits:
+                    self._bits[flag] = 1 << len(self._names)
+                    self._names.append(flag)
+                return self._bits[flag]
+
+    def mask(self, flags):
+
+        m = 0
+        for f in flags:
+            m |= self.bit(f)
+        return m
+
+    def names(self, mask):
+
+        names = []
+        i = 0
+        while mask:
+            if mask & 1:
+                names.append(self._names[i])
+            mask >>= 1
+            i += 1
+        return names
+
+
+UNIVERSE = FlagUniverse()
+
+
+def split_mask(flags):
+
+    on = off = 0
+    for f in flags:
+        if f[0] == "-":
+            off |= UNIVERSE.bit(f[1:])
+        else:
+            on |= UNIVERSE.bit(f.lstrip("+"))
+    return on, off
+
+
+def global_masks():
+
+    # imported here: the flag universe itself is used by dependency.flatten
+    # in the portage-free depgraph and revdeps code
+    from .metadata import METADATA
+    return split_mask(METADATA.get_system("USE").split())
+
+
+class UseState(object):
+
+    __slots__ = ("package", "global_on", "global_off", "added", "removed", "iuse", "locked")
+
+    def __init__(self, package, global_on, global_off, new_flags=(), iuse=None, locked=0):
+
+        # iuse: mask of the package's IUSE (None: unknown, no restriction);
+        # locked: IUSE flags forced or masked by the profile, which keep the
+        # state portage gave them in 'package'
+        self.package = package
+        self.global_on = global_on
+        self.global_off = global_off
+        self.added = 0
+        self.removed = 0
+        self.iuse = iuse
+        self.locked = locked
+
+        for f in new_flags:
+            self.stage(f)
+
+    def stage(self, f):
+
+        reverted = f[0] == "~"
+        if reverted:
+            f = f[1:]
+
+        if f[0] == "-":
+            bit = UNIVERSE.bit(f[1:])
+            if not (reverted and bit & self.global_on):
+                self.removed |= bit
+                self.added &= ~bit
+        else:
+            bit = UNIVERSE.bit(f)
+            if not (reverted and bit & self.global_off):
+                self.added |= bit
+                self.removed &= ~bit
+
+    @property
+    def effective(self):
+
+        # staged flags outside IUSE have no effect; portage's own USE keeps
+        # its implicit flags (ARCH, ELIBC, KERNEL, ...)
+        added = self.added if self.iuse is None else self.added & self.iuse
+        mask = (self.package | added) & ~self.removed
+        return (mask & ~self.locked) | (self.package & self.locked)
+
+
+def iuse_masks(pkg, installed=False):
+
+    iuse = UNIVERSE.mask(f.lstrip("+-") for f in pkg.get_iuse_flags(installed=installed, removeForced=False))
+    free = UNIVERSE.mask(f.lstrip("+-") for f in pkg.get_iuse_flags(installed=installed, removeForced=True))
+    return iuse, iuse & ~free
+
+
+def use_state(pkg):
+
+    on, off = global_masks()
+    package = UNIVERSE.mask(pkg.get_cached_global_settings("USE", installed=False).split())
+    iuse, locked = iuse_masks(pkg)
+    return UseState(package, on, off, pkg.get_new_use_flags(), iuse, locked)
+
+
+def diff_use(a, b):
+
+    # flags enabled only in package a, and only in package b
+    a, b = use_state(a).effective, use_state(b).effective
+    return UNIVERSE.names(a & ~b), UNIVERSE.names(b & ~a)
@@ -2,28 +2,58 @@
 
 __docformat__ = "restructuredtext"
 
-from collections import defaultdict
+import itertools
+from functools import lru_cache
+from threading import Lock
+from weakref import WeakValueDictionary
 
-from .helper import debug
-from .backend import system
+from .helper import debug, paren_reduce
+
+DEPENDENCY_CACHE_SIZE = 4096
+USE_EVAL_CACHE_SIZE = 8192
+
+_nodes = WeakValueDictionary()  # (class, structure) -> node
+_nodes_lock = Lock()
+
+
+def _intern(cls, key, init):
+
+    with _nodes_lock:
+        node = _nodes.get((cls, key))
+        if node is None:
+            node = object.__new__(cls)
+            init(node)
+            _nodes[(cls, key)] = node
+
+        return node
 
 
 class Dependency(object):
-    def __init__(self, dep):
 
-        self._dep = dep
+    __slots__ = ("_dep", "__weakref__")
+
+    def __new__(cls, dep):
+
+        def init(node):
+            node._dep = dep
+
+        return _intern(cls, dep, init)
+
+    def is_satisfied(self, installed=None):
+
+        if installed is not None:
+            return installed.satisfies(self.dep)
 
-    def is_satisfied(self):
-        (
+        # imported here: the system backend needs portage, which the
+        # vdb-only users of this module (revdeps, depgraph) do without
+        from .backend import system
+        return (
             system.find_best_match(self.dep, only_cpv=True, only_installed=True)
             is not None
         )
 
-    def __cmp__(self, b):
-        return cmp(self.dep, b.dep)
-
-    def __hash__(self):
-        return hash(self.dep)
+    def __lt__(self, b):
+        return self.dep < b.dep
 
     def __str__(self):
         return "<Dependency '%s'>" % self.dep
@@ -37,90 +67,268 @@ class Dependency(object):
     satisfied = property(is_satisfied)
 
 
+def _is_active(flag, use):
+
+    if flag[0] == "!":
+        return flag[1:] not in use
+    return flag in use
+
+
+# Trees are immutable and hash-consed: building a node with the structure of
+# an existing one returns that node, so identical subtrees (e.g. of consecutive
+# versions of a package) are shared. Empty groups and conditionals are dropped.
+# Children keep their source order, which decides the preferred || alternative.
 class DependencyTree(object):
-    def __init__(self):
 
-        self.deps = set()
-        self.flags = defaultdict(UseDependency)
-        self._ors = []
-        self._subs = []
+    __slots__ = ("_items", "_deps", "_flags", "_ors", "_subs", "__weakref__")
+
+    def __new__(cls, items=()):
+
+        # items: Dependency, OrDependency, plain DependencyTree (a group of an
+        # OrDependency) or (flag, UseDependency) in source order
+        kept = []
+        seen = set()
+        for i in items:
+            if isinstance(i, Dependency):
+                if i not in seen:
+                    seen.add(i)
+                    kept.append(i)
+            elif not (i[1] if isinstance(i, tuple) else i).is_empty():
+                kept.append(i)
+        items = tuple(kept)
+
+        def init(node):
+            node._items = items
+            node._deps = frozenset(i for i in items if isinstance(i, Dependency))
+            node._flags = tuple(i for i in items if isinstance(i, tuple))
+            node._ors = tuple(i for i in items if isinstance(i, OrDependency))
+            node._subs = tuple(
+                i for i in items
+                if isinstance(i, DependencyTree) and not isinstance(i, OrDependency)
+            )
+
+        return _intern(cls, items, init)
 
     def is_empty(self):
-        return not (self.deps or self.flags or self._ors or self._subs)
+        return not (self._deps or self._flags or self._ors or self._subs)
 
     empty = property(is_empty)
 
-    def add(self, dep, *moredeps):
+    @property
+    def deps(self):
+        return self._deps
 
-        self.deps.add(Dependency(dep))
+    @property
+    def flags(self):
+        return dict(self._flags)
 
-        for dep in moredeps:
-            self.deps.add(Dependency(dep))
+    def get_ors(self):
+        return iter(self._ors)
 
-    def add_or(self):
+    def get_subs(self):
+        return iter(self._subs)
 
-        o = OrDependency()
-        self._ors.append(o)
-        return o
+    ors = property(get_ors)
+    subs = property(get_subs)
 
-    def add_sub(self):
+    def active_flags(self, use):
 
-        return self
+        for flag, tree in self._flags:
+            if _is_active(flag, use):
+                yield tree
 
-    def add_flag(self, flag):
+    def _children(self, use):
 
-        return self.flags[flag]
+        for i in self._items:
+            if isinstance(i, tuple):
+                if _is_active(i[0], use):
+                    yield i[1]
+            else:
+                yield i
+
+    def _evaluate(self, installed, use, result):
+
+        for child in self._children(use):
+            if child not in result:
+                if isinstance(child, Dependency):
+                    result[child] = child.is_satisfied(installed)
+                else:
+                    child._evaluate(installed, use, result)
+
+        result[self] = self._combine(result[c] for c in self._children(use))
+
+    def _combine(self, results):
+        return all(results)
+
+    def evaluate(self, installed, use=()):
+
+        # maps every node reachable under the given USE flags to whether it
+        # is satisfied; shared subtrees and atoms are only evaluated once
+        result = {}
+        self._evaluate(installed, use, result)
+        return result
+
+    def missing(self, result, use=()):
+
+        for child in self._children(use):
+            if result.get(child, True):
+                continue
+
+            if isinstance(child, (Dependency, OrDependency)):
+                yield child
+            else:
+                for m in child.missing(result, use):
+                    yield m
 
-    def parse(self, deps):
+    @classmethod
+    def _collect(cls, tokens, items, flags):
 
-        it = iter(deps)
+        it = iter(tokens)
         for dep in it:
 
-            if dep[-1] == "?":
-                ntree = self.add_flag(dep[:-1])
+            if isinstance(dep, list):
+                if cls is OrDependency:
+                    items.append(DependencyTree.from_list(dep))
+                else:  # plain groups are merged into their parent
+                    cls._collect(dep, items, flags)
+
+            elif dep[-1] == "?":
                 n = next(it)
-                if not hasattr(n, "__iter__"):
+                if not isinstance(n, list):
                     n = [n]
-                ntree.parse(n)
+                flag = dep[:-1]
+                if flag not in flags:  # repeated conditionals are merged into the first
+                    flags[flag] = []
+                    items.append(flag)
+                flags[flag].extend(n)
 
             elif dep == "||":
                 n = next(it)
-                if not hasattr(n, "__iter__"):
+                if not isinstance(n, list):
                     n = [n]
-
-                self.add_or().parse(n)
-
-            elif isinstance(dep, list):
-                self.add_sub().parse(dep)
+                items.append(OrDependency.from_list(n))
 
             else:
-                self.add(dep)
+                items.append(Dependency(dep))
 
-    def get_non_empty(self, l):
+    @classmethod
+    def from_list(cls, tokens):
 
-        for d in l[:]:
-            if d.is_empty():
-                l.remove(d)
-            else:
-                yield d
+        items = []
+        flags = {}
+        cls._collect(tokens, items, flags)
 
-    def get_ors(self):
-        return self.get_non_empty(self._ors)
+        return cls(
+            (i, UseDependency.from_list(flags[i])) if isinstance(i, str) else i
+            for i in items
+        )
 
-    def get_subs(self):
-        return self.get_non_empty(self._subs)
 
-    ors = property(get_ors)
-    subs = property(get_subs)
+class OrDependency(DependencyTree):
 
+    __slots__ = ()
 
-class OrDependency(DependencyTree):
-    def add_sub(self):
-        s = DependencyTree()
-        self._subs.append(s)
-        return s
+    def _combine(self, results):
+
+        results = list(results)
+        return not results or any(results)
 
 
 class UseDependency(DependencyTree):
 
-    pass
+    __slots__ = ()
+
+
+@lru_cache(maxsize=DEPENDENCY_CACHE_SIZE)
+def parse_dependencies(deps):
+
+    return DependencyTree.from_list(paren_reduce(deps))
+
+
+# Flattened trees: an AllOf holds atoms and AnyOf groups which all have to be
+# satisfied, an AnyOf the alternatives of a || group (atoms, AllOfs or AnyOfs).
+class AllOf(tuple):
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "AllOf(%s)" % ", ".join(map(repr, self))
+
+
+class AnyOf(tuple):
+
+    __slots__ = ()
+
+    def __repr__(self):
+        return "AnyOf(%s)" % ", ".join(map(repr, self))
+
+
+@lru_cache(maxsize=USE_EVAL_CACHE_SIZE)
+def used_flags(tree):
+
+    flags = set(f.lstrip("!") for f, t in tree._flags)
+    for child in itertools.chain((t for f, t in tree._flags), tree._ors, tree._subs):
+        flags.update(used_flags(child))
+
+    return frozenset(flags)
+
+
+def _all_of(tree, use, items):
+
+    for child in tree._children(use):
+        if isinstance(child, Dependency):
+            items.append(child.dep)
+        elif isinstance(child, OrDependency):
+            items.append(_any_of(child, use))
+        else:
+            _all_of(child, use, items)
+
+    return items
+
+
+def _alternative(tree, use):
+
+    items = _all_of(tree, use, [])
+    if len(items) == 1:
+        return items[0]
+    return AllOf(items)
+
+
+def _any_of(tree, use):
+
+    alts = []
+    for child in tree._children(use):
+        if isinstance(child, Dependency):
+            alts.append(child.dep)
+        elif isinstance(child, OrDependency):
+            alts.append(_any_of(child, use))
+        else:
+            alts.append(_alternative(child, use))
+
+    return AnyOf(alts)
+
+
+@lru_cache(maxsize=USE_EVAL_CACHE_SIZE)
+def _flatten(tree, mask):
+
+    from .backend.use_state import UNIVERSE
+    return AllOf(_all_of(tree, set(UNIVERSE.names(mask)), []))
+
+
+def flatten(tree, use):
+
+    # memoized per (tree, enabled flags the tree actually refers to), so
+    # unrelated USE changes keep hitting the same entry
+    from .backend.use_state import UNIVERSE
+    if not isinstance(use, int):
+        use = UNIVERSE.mask(use)
+
+    return _flatten(tree, use & UNIVERSE.mask(used_flags(tree)))
+
+
+def diff_flattened(tree, old_use, new_use):
+
+    old, new = flatten(tree, old_use), flatten(tree, new_use)
+    old_set, new_set = set(old), set(new)
+
+    return [i for i in new if i not in old_set], [i for i in old if i not in new_set]
@@ -1,6 +1,13 @@
-import os, shlex, subprocess, threading, time, io
-from gi.repository import Gtk, GLib
+import os, sys, shlex, subprocess, threading, time, io
+from gi.repository import Gtk, GLib, GObject
 import json
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from .backend.snapshot import ConfigSnapshot
+from .backend.config_watcher import ConfigWatcher
+from .backend.config_index import INDEX
+from .backend.transaction import Transaction, diff_files
 
 # -------------------- helpers --------------------
 # -------------------- config/persist helpers --------------------
@@ -52,6 +59,19 @@ def _run_capture(cmd):
 def _has(cmd):
     return subprocess.call(["which", cmd], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) == 0
 
+# -------------------- search ---------------------
+SEARCH_BATCH = 200      # rows per GLib.idle_add
+SEARCH_FLUSH = 0.016    # seconds; flush earlier so first rows appear within a frame
+TYPEAHEAD_DELAY = 200   # ms of typing pause before searching
+TYPEAHEAD_MIN = 2       # characters needed for type-ahead
+
+# -------------------- details loading ------------
+DETAILS_CACHE_SIZE = 128  # loaded packages kept by DetailsWidget
+DETAILS_PREFETCH = 2      # rows above/below the cursor loaded speculatively
+_DETAILS_POOL = ThreadPoolExecutor(max_workers=2, thread_name_prefix="details")
+# speculative loads queue here, so they never delay the row the user selected
+_PREFETCH_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="details-prefetch")
+
 # -------------------- models ---------------------
 class OutputPane:
     def __init__(self):
@@ -83,7 +103,18 @@ class SearchModel(Gtk.ListStore):
 
 class InstalledModel(Gtk.ListStore):
     def __init__(self):
-        super().__init__(str, str)  # atom, version
+        super().__init__(str, str, str, GObject.TYPE_INT64, str)  # atom, version, slot, size (bytes), build date
+
+def _render_size(col, cell, model, itr, colid):
+    size = model.get_value(itr, colid)
+    cell.set_property("text", _format_size(size) if size else "")
+
+def _format_size(size):
+    for unit in ("B", "KiB", "MiB"):
+        if size < 1024:
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} GiB"
 
 # -------------------- details widget -------------
 class DetailsWidget(Gtk.Box):
@@ -95,6 +126,7 @@ class DetailsWidget(Gtk.Box):
         super().__init__(orientation=Gtk.Orientation.VERTICAL, spacing=6)
 
         self.atom = None
+        self.dep_tree = None  # parsed DEPEND/RDEPEND/PDEPEND, if the backend is available
         self.meta = {}      # homepage, license, description, keywords
         self.flags = []     # [(flag, enabled_bool, description)]
         self.target_flags = {}  # desired state after toggles
@@ -125,6 +157,14 @@ class DetailsWidget(Gtk.Box):
         grid.attach(Gtk.Label(label="Keywords:", xalign=0), 0, row, 1, 1)
         grid.attach(self.lbl_kw, 1, row, 1, 1); row += 1
 
+        self.lbl_rdeps = Gtk.Label(xalign=0, wrap=True, selectable=True)
+        grid.attach(Gtk.Label(label="Required by:", xalign=0, yalign=0), 0, row, 1, 1)
+        grid.attach(self.lbl_rdeps, 1, row, 1, 1); row += 1
+
+        self.lbl_depdiff = Gtk.Label(xalign=0, wrap=True, selectable=True)
+        grid.attach(Gtk.Label(label="Dependency changes:", xalign=0, yalign=0), 0, row, 1, 1)
+        grid.attach(self.lbl_depdiff, 1, row, 1, 1); row += 1
+
         # IUSE flags area (scrolled)
         self.flag_box = Gtk.Box(orientation=Gtk.Orientation.VERTICAL, spacing=2)
         sc = Gtk.ScrolledWindow()
@@ -153,6 +193,13 @@ class DetailsWidget(Gtk.Box):
         self.output_cb = None  # set by parent to append to output
         self.priv_cb = None    # set by parent to run privileged command
         self.status_cb = None  # set by parent to set status
+        self.preview_cb = None # set by parent to show the pending package.use diff
+
+        self.generation = 0         # bumped on config changes; part of the cache key
+        self._cache = OrderedDict() # (atom, generation) -> loaded details, LRU
+        self._inflight = {}         # (atom, generation) -> Future
+        self._inflight_pool = {}    # (atom, generation) -> executor running it
+        self._set_flag_actions(False)
 
     def set_callbacks(self, output_append, run_priv, set_status):
         self.output_cb = output_append
@@ -171,12 +218,96 @@ class DetailsWidget(Gtk.Box):
     def load_atom(self, atom):
         self.atom = atom
         self.lbl_atom.set_text(atom)
+        key = (atom, self.generation)
+        data = self._cache_get(key)
+        if data is not None:
+            self._drop_inflight(key)
+            self._show(atom, data)
+            return
+        self.flag_box.foreach(lambda w: self.flag_box.remove(w))  # clear
+        self.lbl_desc.set_text("Loading ...")
+        # the previous package's flags must not be saved under the new atom
+        self.flags = []
+        self.target_flags = {}
+        self.dep_tree = None
+        self._set_flag_actions(False)
+        self._drop_inflight(key)
+        self._submit(key, _DETAILS_POOL)
+
+    def _drop_inflight(self, keep):
+        # the selection moved on: drop queued loads that did not start yet
+        for k, fut in list(self._inflight.items()):
+            if k != keep and fut.cancel():
+                del self._inflight[k]
+                del self._inflight_pool[k]
+
+    def prefetch(self, atoms):
+        # speculatively load rows next to the cursor
+        for atom in atoms:
+            key = (atom, self.generation)
+            if self._cache_get(key, touch=False) is None:
+                self._submit(key, _PREFETCH_POOL)
+
+    def invalidate(self):
+        # configuration changed: cached details are stale
+        self.generation += 1
+
+    def _submit(self, key, pool):
+        fut = self._inflight.get(key)
+        if fut is not None:
+            # a queued prefetch of the selected row moves to the foreground pool
+            if pool is _PREFETCH_POOL or self._inflight_pool.get(key) is pool or not fut.cancel():
+                return
+        fut = pool.submit(self._fetch_all, key[0])
+        self._inflight[key] = fut
+        self._inflight_pool[key] = pool
+        fut.add_done_callback(lambda f: GLib.idle_add(self._on_loaded, key, f))
+
+    def _cache_get(self, key, touch=True):
+        data = self._cache.get(key)
+        if data is not None and touch:
+            self._cache.move_to_end(key)
+        return data
+
+    def _on_loaded(self, key, fut):
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+            del self._inflight_pool[key]
+        if fut.cancelled():
+            return False
+        try:
+            data = fut.result()
+        except Exception as e:
+            data = {"meta": {"description": f"Could not load details: {e}"}, "flags": [],
+                    "dep_tree": None, "rdeps": ""}
+        else:
+            self._cache[key] = data
+            self._cache.move_to_end(key)
+            while len(self._cache) > DETAILS_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        if key == (self.atom, self.generation):
+            self._show(key[0], data)
+        return False
+
+    def _fetch_all(self, atom):
+        # runs in the details executor; must not touch widgets
+        meta = self._fetch_meta(atom)
+        return {
+            "meta": meta,
+            "flags": self._fetch_flags(atom),
+            "dep_tree": self._parse_deps(meta.get("deps_raw", "")),
+            "rdeps": self._fetch_rdeps(atom),
+        }
+
+    def _show(self, atom, data):
         self.flag_box.foreach(lambda w: self.flag_box.remove(w))  # clear
-        self.meta = self._fetch_meta(atom)
-        self.flags = self._fetch_flags(atom)
+        self.meta = data["meta"]
+        self.flags = data["flags"]
+        self.dep_tree = data["dep_tree"]
 
         self.lbl_desc.set_text(self.meta.get("description",""))
-        home = (self.meta.get("homepage","") or "").split()[0]
+        home = (self.meta.get("homepage","") or "").split()
+        home = home[0] if home else ""
         try:
             self.lbl_home.set_uri(home if home else "")
             self.lbl_home.set_label(home if home else "")
@@ -184,6 +315,7 @@ class DetailsWidget(Gtk.Box):
             pass
         self.lbl_lic.set_text(self.meta.get("license",""))
         self.lbl_kw.set_text(self.meta.get("keywords",""))
+        self.lbl_rdeps.set_text(data["rdeps"])
 
         # checkboxes
         self.target_flags = {}
@@ -196,6 +328,9 @@ class DetailsWidget(Gtk.Box):
             self.flag_box.pack_start(hb, False, False, 0)
             self.target_flags[flag] = bool(enabled)
         self.flag_box.show_all()
+        self._set_flag_actions(True)
+        self._update_preview(changed=False)
+        self._update_dep_diff()
 
     # -------- actions ----------
     def on_depgraph(self, _btn):
@@ -213,13 +348,73 @@ class DetailsWidget(Gtk.Box):
         except Exception:
             pass
 
-    def on_save_flags(self, _btn):
-        if not self.atom or not self.target_flags:
-            return
-        # Build flags string like: "flag1 -flag2 ..."
+    def _flag_parts(self):
+        # Build flags list like: ["flag1", "-flag2", ...]
         parts = []
         for f, enabled in sorted(self.target_flags.items()):
             parts.append(f if enabled else f"-{f}")
+        return parts
+
+    def _changed_flags(self):
+        # only the toggled flags, as 'portato use' takes them
+        loaded = dict((f, bool(enabled)) for f, enabled, _desc in self.flags)
+        return [f if enabled else f"-{f}" for f, enabled in sorted(self.target_flags.items())
+                if loaded.get(f) != enabled]
+
+    def _stage_flags(self):
+        # stage the toggled flags in the backend journal, exactly like
+        # 'portato use'; None without a portage backend
+        try:
+            from .backend import flags
+        except ImportError:
+            return None
+        cpv = flags.find_use_target(self.atom)
+        if cpv is None:
+            return None
+        flags.remove_new_use_flags(cpv)
+        changed = self._changed_flags()
+        if changed:
+            flags.set_use_flags([(cpv, changed)])
+        return flags
+
+    def preview_flags(self):
+        # in-memory diff of what on_save_flags would do to package.use
+        if not self.atom or not self.target_flags or not self.btn_save_flags.get_sensitive():
+            return ""
+        flags = self._stage_flags()
+        if flags is not None:
+            return flags.diff_changes(masked=False, testing=False)
+        path = "/etc/portage/package.use/portato"
+        cf = INDEX.get_file(path) if os.path.isfile(path) else None
+        trans = Transaction()
+        for no, ln in enumerate(cf.lines if cf is not None else [], 1):
+            if ln.startswith(self.atom + " "):
+                trans.edit(path, no, lambda l: "")
+        trans.append(path, f"{self.atom} {' '.join(self._flag_parts())}\n")
+        return diff_files(trans, INDEX)
+
+    def _set_flag_actions(self, sensitive):
+        # save/reset only act on flags that _show loaded for self.atom
+        self.btn_save_flags.set_sensitive(sensitive)
+        self.btn_reset_flags.set_sensitive(sensitive)
+
+    def _update_preview(self, changed=True):
+        if self.preview_cb:
+            self.preview_cb(self.preview_flags() if changed else "")
+
+    def on_save_flags(self, _btn):
+        if not self.atom or not self.target_flags or not self.btn_save_flags.get_sensitive():
+            return
+        if self._stage_flags() is not None:
+            # the CLI writes what the preview showed
+            changed = self._changed_flags()
+            if not changed:
+                return
+            cmd = ["portato"] if _has("portato") else [sys.executable, "-m", "portato"]
+            if self.priv_cb:
+                self.priv_cb(cmd + ["use", self.atom, "--"] + changed)
+            return
+        parts = self._flag_parts()
         script = (
             "set -e; "
             "sudo mkdir -p /etc/portage/package.use; "
@@ -236,9 +431,64 @@ class DetailsWidget(Gtk.Box):
 
     def _on_toggle_flag(self, widget, flag):
         self.target_flags[flag] = widget.get_active()
+        self._update_preview()
+        self._update_dep_diff()
+
+    def _update_dep_diff(self):
+        # added/removed dependencies of the toggled USE, from the memoized evaluator
+        self.lbl_depdiff.set_text("")
+        if self.dep_tree is None:
+            return
+        from .dependency import diff_flattened
+        old_use = [f for f, enabled, _desc in self.flags if enabled]
+        new_use = [f for f, enabled in self.target_flags.items() if enabled]
+        added, removed = diff_flattened(self.dep_tree, old_use, new_use)
+        lines = [f"+ {d}" for d in added] + [f"- {d}" for d in removed]
+        self.lbl_depdiff.set_text("\n".join(lines) if lines else "(none)")
 
     # -------- data fetching -----
+    def _parse_deps(self, deps):
+        if not deps:
+            return None
+        try:
+            from .dependency import parse_dependencies
+            return parse_dependencies(deps)
+        except Exception:
+            return None
+
+    def _fetch_rdeps(self, atom):
+        # installed packages depending on atom, from the persisted vdb index
+        try:
+            from .backend.revdeps import REVDEPS
+            found = REVDEPS.rdepends(atom)
+        except Exception:
+            return ""
+        if not found:
+            return "(nothing installed)"
+        cpvs = sorted(set(cpv for cpv, _dep in found))
+        return "\n".join(cpvs[:50]) + (f"\n... {len(cpvs) - 50} more" if len(cpvs) > 50 else "")
+
+    def _cached_entry(self, atom):
+        # best repository index entry for atom, or None
+        try:
+            from .backend.repo_cache import REPO_CACHE
+            from .backend.use_resolver import RESOLVER
+            return REPO_CACHE.match(atom, RESOLVER.is_visible) if REPO_CACHE.is_open() else None
+        except Exception:
+            return None
+
     def _fetch_meta(self, atom):
+        e = self._cached_entry(atom)
+        if e is not None:
+            deps = e.read()
+            return {
+                "description": e.description,
+                "homepage": e.homepage,
+                "license": e.license,
+                "keywords": e.keywords,
+                "iuse_raw": e.iuse,
+                "deps_raw": " ".join(deps.get(k,"") for k in ("DEPEND","RDEPEND","PDEPEND")),
+            }
         # Try Portage API
         try:
             import portage
@@ -247,7 +497,7 @@ class DetailsWidget(Gtk.Box):
             meta = {}
             if matches:
                 cpv = matches[-1]  # choose 'latest'
-                fields = ["DESCRIPTION","HOMEPAGE","LICENSE","KEYWORDS","IUSE"]
+                fields = ["DESCRIPTION","HOMEPAGE","LICENSE","KEYWORDS","IUSE","DEPEND","RDEPEND","PDEPEND"]
                 data = dict(zip(fields, portdb.aux_get(cpv, fields)))
                 meta = {
                     "description": data.get("DESCRIPTION",""),
@@ -255,6 +505,7 @@ class DetailsWidget(Gtk.Box):
                     "license": data.get("LICENSE",""),
                     "keywords": data.get("KEYWORDS",""),
                     "iuse_raw": data.get("IUSE",""),
+                    "deps_raw": " ".join(data.get(k,"") for k in ("DEPEND","RDEPEND","PDEPEND")),
                 }
                 return meta
         except Exception:
@@ -317,19 +568,36 @@ class DetailsWidget(Gtk.Box):
             stack.append((indent, cur))
 
     def _fetch_flags(self, atom):
-        # Prefer Portage API for IUSE list + pretend for status
+        # Resolve USE in-process from the repository index and the profile
+        e = self._cached_entry(atom)
+        if e is not None:
+            try:
+                from .backend.use_resolver import RESOLVER
+                from .backend.use_desc import DESCRIPTIONS
+                iuse = [f for f in e.iuse.split() if f]
+                enabled = RESOLVER.resolve(e.cpv, iuse, e.slot or "0")[0]
+                names = sorted(set(f.lstrip("+-") for f in iuse))
+                descs = DESCRIPTIONS.describe_all(e.cp, names)
+                return [(f, f in enabled, descs[f]) for f in names]
+            except Exception:
+                pass
+
+        # Fallback: Portage API for IUSE list + pretend for status
         flags = []
         iuse = []
-        try:
-            import portage
-            portdb = portage.db["/"]["porttree"].dbapi
-            matches = portdb.match(atom)
-            if matches:
-                cpv = matches[-1]
-                iuse_raw = portdb.aux_get(cpv, ["IUSE"])[0]
-                iuse = [f.lstrip("+-") for f in iuse_raw.split() if f]
-        except Exception:
-            pass
+        if e is not None:
+            iuse = [f.lstrip("+-") for f in e.iuse.split() if f]
+        else:
+            try:
+                import portage
+                portdb = portage.db["/"]["porttree"].dbapi
+                matches = portdb.match(atom)
+                if matches:
+                    cpv = matches[-1]
+                    iuse_raw = portdb.aux_get(cpv, ["IUSE"])[0]
+                    iuse = [f.lstrip("+-") for f in iuse_raw.split() if f]
+            except Exception:
+                pass
 
         enabled = set()
         disabled = set()
@@ -389,6 +657,7 @@ class PortatoGUI(Gtk.Window):
         self.installed_model = InstalledModel()
         self.details = DetailsWidget()
         self.details.set_callbacks(self.output.append, self._run_privileged, self._set_status)
+        self.config_snapshot = ConfigSnapshot("/etc/portage").load()
 
         # Emerge options
         self.opt_deep = Gtk.CheckButton(label="--deep")
@@ -405,6 +674,11 @@ class PortatoGUI(Gtk.Window):
         hb = Gtk.Box(orientation=Gtk.Orientation.HORIZONTAL, spacing=6)
         self.search_entry = Gtk.Entry()
         self.search_entry.set_placeholder_text("Search atom (e.g., app-editors/vim)")
+        self.search_entry.connect("changed", self._on_search_changed)
+        self.search_entry.connect("activate", self.on_search)
+        self._search_gen = 0       # bumped per query; stale workers drop their rows
+        self._search_proc = None   # running 'emerge -s' fallback, if any
+        self._typeahead_id = None
         btn_search = Gtk.Button(label="Search")
         btn_search.connect("clicked", self.on_search)
         btn_pretend = Gtk.Button(label="Pretend")
@@ -453,11 +727,17 @@ class PortatoGUI(Gtk.Window):
 
         # Installed tab
         self.inst_tree = Gtk.TreeView(model=self.installed_model)
-        for title, colid, width in [("Atom", 0, 480), ("Version", 1, 120)]:
+        for title, colid, width in [("Atom", 0, 360), ("Version", 1, 120), ("Slot", 2, 60),
+                                    ("Size", 3, 80), ("Built", 4, 100)]:
             renderer = Gtk.CellRendererText()
-            col = Gtk.TreeViewColumn(title, renderer, text=colid)
+            if title == "Size":  # stored in bytes, so it sorts numerically
+                col = Gtk.TreeViewColumn(title, renderer)
+                col.set_cell_data_func(renderer, _render_size, colid)
+            else:
+                col = Gtk.TreeViewColumn(title, renderer, text=colid)
             col.set_resizable(True)
             col.set_min_width(width)
+            col.set_sort_column_id(colid)
             self.inst_tree.append_column(col)
         btn_inst_refresh = Gtk.Button(label="Refresh Installed")
         btn_inst_refresh.connect("clicked", self.on_installed_refresh)
@@ -602,6 +882,12 @@ class PortatoGUI(Gtk.Window):
         right.append_page(self.details, Gtk.Label(label="Details"))
         right.append_page(self.output.widget(), Gtk.Label(label="Output"))
         right.append_page(self._scrolled(self.deptree_view), Gtk.Label(label="Dep Tree"))
+        self.pending_buf = Gtk.TextBuffer()
+        pending_view = Gtk.TextView(buffer=self.pending_buf)
+        pending_view.set_editable(False)
+        pending_view.set_monospace(True)
+        right.append_page(self._scrolled(pending_view), Gtk.Label(label="Pending Changes"))
+        self.details.preview_cb = lambda text: self.pending_buf.set_text(text or "(no pending changes)")
         paned.add2(right)
 
         # status bar
@@ -610,6 +896,9 @@ class PortatoGUI(Gtk.Window):
         outer.pack_start(self.status, False, False, 0)
 
         self.connect("destroy", Gtk.main_quit)
+        # refresh visible rows when /etc/portage is edited outside of Portato
+        self.config_watcher = self._watch_config(lambda paths, cps: GLib.idle_add(self._on_config_changed, paths))
+        self._open_repo_cache()
         self.on_world_refresh(None)
         self.on_installed_refresh(None)
         self.on_news_refresh(None)
@@ -635,6 +924,40 @@ class PortatoGUI(Gtk.Window):
     def _set_status(self, msg):
         self.status.push(0, msg)
 
+    def _open_repo_cache(self):
+        # map the persisted repository index; build it in the background if missing
+        try:
+            from .backend.repo_cache import REPO_CACHE
+        except Exception:
+            return
+        if not REPO_CACHE.open():
+            threading.Thread(target=REPO_CACHE.update, daemon=True).start()
+
+    def _watch_config(self, callback):
+        # the backend's watcher also drops its own caches (flags.config_changed)
+        # and watches the config path portage reports
+        try:
+            from .backend import flags
+        except ImportError:
+            from .backend.use_resolver import CONFIG_PATH
+            watcher = ConfigWatcher(CONFIG_PATH, INDEX)
+            watcher.connect(callback)
+            watcher.start()
+            return watcher
+        return flags.watch_config(callback)
+
+    def _on_config_changed(self, paths):
+        self._set_status("Configuration changed: " + ", ".join(os.path.basename(p) for p in paths))
+        self.details.invalidate()
+        try:
+            from .backend.use_resolver import RESOLVER
+            RESOLVER.invalidate()
+        except Exception:
+            pass
+        if self.details.atom:
+            self.details.load_atom(self.details.atom)
+        return False
+
     def build_emerge_opts(self):
         opts = []
         if self.opt_deep.get_active():
@@ -650,17 +973,23 @@ class PortatoGUI(Gtk.Window):
             opts.extend(["--jobs", str(jobs)])
         return opts
 
-    def _run_privileged(self, args):
+    def _run_privileged(self, args, done_cb=None):
+        def done(rc):
+            self._set_status(f"Done (rc={rc})")
+            if done_cb:
+                done_cb(rc)
         if _has("pkexec"):
             cmd = ["pkexec"] + args
             self.output.clear()
             self._set_status(" ".join(shlex.quote(a) for a in cmd))
-            _run_stream(cmd, self.output.append, lambda rc: self._set_status(f"Done (rc={rc})"))
+            _run_stream(cmd, self.output.append, done)
             return
         if _has("xterm"):
             cmd = ["xterm", "-e", "sudo"] + args
             self.output.append("Launching terminal: " + " ".join(shlex.quote(a) for a in cmd))
-            subprocess.Popen(cmd)
+            p = subprocess.Popen(cmd)
+            if done_cb:
+                threading.Thread(target=lambda: GLib.idle_add(done, p.wait()), daemon=True).start()
             self._set_status("Terminal launched")
             return
         self.output.append("Run manually:\n  sudo " + " ".join(shlex.quote(a) for a in args))
@@ -671,6 +1000,15 @@ class PortatoGUI(Gtk.Window):
         atom = self._selected_search_atom()
         if atom:
             self.details.load_atom(atom)
+            self.details.prefetch(self._neighbour_atoms())
+
+    def _neighbour_atoms(self):
+        model, itr = self.results_tree.get_selection().get_selected()
+        if not itr:
+            return []
+        row = model.get_path(itr).get_indices()[0]
+        rows = range(max(0, row - DETAILS_PREFETCH), min(len(model), row + DETAILS_PREFETCH + 1))
+        return [model[r][0] for r in rows if r != row]
 
     def on_results_activate(self, tree, path, col):
         it = self.search_model.get_iter(path)
@@ -680,37 +1018,35 @@ class PortatoGUI(Gtk.Window):
         self._set_status(f"Queued {atom} for install")
         self.details.load_atom(atom)
 
-    def on_search(self, _btn):
-        atom = self.search_entry.get_text().strip()
-        if not atom:
-            self._set_status("Enter search text")
-            return
-        self.search_model.clear()
-        self._set_status(f"Searching {atom} ...")
-        if _has("equery"):
-            rc, out = _run_capture(["equery", "list", "-po", atom])
-            entries = [l.strip() for l in out.splitlines() if l.strip()]
-            for e in entries[:800]:
-                e_clean = e.split()[-1]
-                desc = ""
-                rc2, out2 = _run_capture(["equery", "meta", "-d", e_clean])
-                for ln in out2.splitlines():
-                    if ln.lower().startswith("description"):
-                        desc = ln.split(":",1)[1].strip()
-                        break
-                inst = "yes" if e.startswith("I ") else "no"
-                self.search_model.append([e_clean, inst, "", desc])
-        else:
-            rc, out = _run_capture(["emerge", "-s", atom])
-            atom_line = ""
+    def _iter_repository(self, text):
+        # in-process search over the repositories' md5-cache; None if unavailable
+        try:
+            from .backend.repo_cache import REPO_CACHE
+            from .backend.installed import INSTALLED
+            if not REPO_CACHE.is_available():
+                return None
+            installed = set(INSTALLED.cps())
+        except Exception:
+            return None
+        return ((e.cp, "yes" if e.cp in installed else "no", e.version, e.description)
+                for e in REPO_CACHE.iter_search(text))
+
+    def _iter_emerge_search(self, text, gen):
+        # rows parsed from 'emerge -s' output as it arrives
+        p = subprocess.Popen(["emerge", "-s", text], stdout=subprocess.PIPE,
+                             stderr=subprocess.STDOUT, text=True)
+        self._search_proc = p
+        try:
             desc = ""
-            for ln in out.splitlines():
+            for ln in iter(p.stdout.readline, ""):
+                if gen != self._search_gen:
+                    break
+                ln = ln.rstrip("\n")
                 if ln.startswith(" "):
                     if "Description" in ln:
                         desc = ln.split(":",1)[1].strip()
                 elif "/" in ln and ln.strip().startswith("*")==False:
-                    atom_line = ln.strip()
-                    parts = atom_line.split()
+                    parts = ln.strip().split()
                     if parts:
                         namever = parts[0].rstrip(":")
                         if "-" in namever and "/" in namever:
@@ -719,9 +1055,72 @@ class PortatoGUI(Gtk.Window):
                         else:
                             pkg, ver = namever, ""
                         installed = "yes" if "[ Installed " in ln else "no"
-                        self.search_model.append([pkg, installed, ver, desc])
+                        yield (pkg, installed, ver, desc)
                         desc = ""
-        self._set_status("Search done")
+        finally:
+            if p.poll() is None:
+                p.terminate()
+            p.wait()
+
+    def _search_worker(self, text, gen):
+        rows = self._iter_repository(text)
+        try:
+            if rows is None:
+                rows = self._iter_emerge_search(text, gen)
+            batch, count, last = [], 0, time.monotonic()
+            for row in rows:
+                if gen != self._search_gen:
+                    return
+                batch.append(row)
+                # flush often enough that the first rows show up within a frame
+                if len(batch) >= SEARCH_BATCH or time.monotonic() - last > SEARCH_FLUSH:
+                    GLib.idle_add(self._add_search_rows, gen, batch)
+                    count += len(batch)
+                    batch, last = [], time.monotonic()
+            count += len(batch)
+            GLib.idle_add(self._add_search_rows, gen, batch)
+            GLib.idle_add(self._search_done, gen, f"Search done ({count} results)")
+        except Exception as e:
+            GLib.idle_add(self._search_done, gen, f"Search failed: {e}")
+
+    def _add_search_rows(self, gen, rows):
+        if gen == self._search_gen:
+            for row in rows:
+                self.search_model.append(list(row))
+        return False
+
+    def _search_done(self, gen, status):
+        if gen == self._search_gen:
+            self._set_status(status)
+        return False
+
+    def _cancel_search(self):
+        self._search_gen += 1
+        p, self._search_proc = self._search_proc, None
+        if p is not None and p.poll() is None:
+            p.terminate()
+
+    def _on_search_changed(self, _entry):
+        # type-ahead: search once typing pauses
+        if self._typeahead_id is not None:
+            GLib.source_remove(self._typeahead_id)
+        self._typeahead_id = GLib.timeout_add(TYPEAHEAD_DELAY, self._on_typeahead)
+
+    def _on_typeahead(self):
+        self._typeahead_id = None
+        if len(self.search_entry.get_text().strip()) >= TYPEAHEAD_MIN:
+            self.on_search(None)
+        return False
+
+    def on_search(self, _btn):
+        atom = self.search_entry.get_text().strip()
+        if not atom:
+            self._set_status("Enter search text")
+            return
+        self._cancel_search()
+        self.search_model.clear()
+        self._set_status(f"Searching {atom} ...")
+        threading.Thread(target=self._search_worker, args=(atom, self._search_gen), daemon=True).start()
 
     def on_info(self, _btn):
         self.output.clear()
@@ -729,21 +1128,55 @@ class PortatoGUI(Gtk.Window):
         _run_stream(["emerge", "--info"], self.output.append, lambda rc: self._set_status(f"Info done (rc={rc})"))
 
     def on_installed_refresh(self, _btn):
+        # read /var/db/pkg in the background; categories whose mtime did not
+        # change since the last refresh are served from the index cache
+        have_rows = len(self.installed_model) > 0  # read here, not in the worker
+        def worker():
+            try:
+                from .backend.installed import INSTALLED
+                changed = INSTALLED.refresh()
+                pkgs = INSTALLED.packages()
+            except Exception as e:
+                GLib.idle_add(self._fill_installed_legacy, str(e))
+                return
+            if not changed and have_rows:
+                GLib.idle_add(self._set_status, f"Installed: {len(pkgs)} packages (unchanged)")
+                return
+            rows = [(p.cp, p.version, p.slot, p.size,
+                     time.strftime("%Y-%m-%d", time.localtime(p.build_time)) if p.build_time else "")
+                    for p in pkgs]
+            GLib.idle_add(self._fill_installed, rows)
+        self._set_status("Reading installed packages ...")
+        threading.Thread(target=worker, daemon=True).start()
+
+    def _fill_installed(self, rows):
+        # bulk load with the view and sorting detached, then re-attach
+        model = InstalledModel()
+        for row in rows:
+            model.append(list(row))
+        model.set_sort_column_id(0, Gtk.SortType.ASCENDING)
+        self.installed_model = model
+        self.inst_tree.set_model(model)
+        self._set_status(f"Installed: {len(rows)} packages")
+        return False
+
+    def _fill_installed_legacy(self, reason):
         self.installed_model.clear()
         if _has("equery"):
             rc, out = _run_capture(["equery", "list", "-i", "*"])
             for ln in out.splitlines():
                 s = ln.strip()
                 if s and "/" in s:
-                    self.installed_model.append([s, ""])
+                    self.installed_model.append([s, "", "", 0, ""])
         elif _has("qlist"):
             rc, out = _run_capture(["qlist", "-I"])
             for ln in out.splitlines():
                 s = ln.strip()
                 if s and "/" in s:
-                    self.installed_model.append([s, ""])
+                    self.installed_model.append([s, "", "", 0, ""])
         else:
-            self.installed_model.append(["(install gentoolkit or portage-utils for installed list)", ""])
+            self.installed_model.append(["(cannot read /var/db/pkg: " + reason + ")", "", "", 0, ""])
+        return False
 
     def on_queue_add_install(self, _btn):
         atom = self._selected_search_atom()
@@ -787,11 +1220,18 @@ class PortatoGUI(Gtk.Window):
             self._set_status("Queue is empty")
             return
         if install_atoms:
-            self._run_privileged(["emerge", "-av"] + self.build_emerge_opts() + install_atoms)
+            self._run_privileged(["emerge", "-av"] + self.build_emerge_opts() + install_atoms,
+                                 self._on_merge_done)
         if remove_atoms:
-            self._run_privileged(["emerge", "-avC"] + remove_atoms)
+            self._run_privileged(["emerge", "-avC"] + remove_atoms, self._on_merge_done)
         self._persist_queue()
 
+    def _on_merge_done(self, rc):
+        # rescan the vdb; this also drops metadata cached for touched packages
+        self.details.invalidate()
+        self.on_installed_refresh(None)
+        return False
+
     def _queue_rows(self):
         rows = []
         itr = self.queue.get_iter_first()
@@ -908,10 +1348,29 @@ class PortatoGUI(Gtk.Window):
             self.logs_buf.set_text("(no /var/log/emerge.log)")
 
     def on_sync(self, _btn):
-        self._run_privileged(["emerge", "--sync"])
+        self._run_privileged(["emerge", "--sync"], self._on_sync_done)
 
     def on_emaint_sync(self, _btn):
-        self._run_privileged(["emaint", "sync", "-a"])
+        self._run_privileged(["emaint", "sync", "-a"], self._on_sync_done)
+
+    def _on_sync_done(self, rc):
+        # bring the repository index up to date with the synced md5-cache
+        def worker():
+            try:
+                from .backend.repo_cache import REPO_CACHE
+                added, removed, changed = REPO_CACHE.update()
+                from .backend.use_resolver import RESOLVER
+                from .backend.use_desc import DESCRIPTIONS
+                RESOLVER.invalidate()
+                DESCRIPTIONS.invalidate()
+            except Exception as e:
+                GLib.idle_add(self._set_status, f"Repository index update failed: {e}")
+                return
+            GLib.idle_add(self._set_status, f"Repository index: {len(added)} added, "
+                          f"{len(removed)} removed, {len(changed)} changed")
+        self._set_status("Updating repository index ...")
+        threading.Thread(target=worker, daemon=True).start()
+        return False
 
     def on_profiles_refresh(self, _btn):
         rc, out = _run_capture(["eselect", "profile", "list"]) if _has("eselect") else (1, "eselect not found")
@@ -990,27 +1449,15 @@ class PortatoGUI(Gtk.Window):
 
     # -------- Settings (binpkg) --------
     def on_settings_refresh(self, _btn):
-        # naive scan of /etc/portage/make.conf and make.conf.d/ for values
-        features = ""; opts = ""; binhost = ""
-        paths = ["/etc/portage/make.conf"]
-        d = "/etc/portage/make.conf.d"
-        if os.path.isdir(d):
-            for fn in sorted(os.listdir(d)):
-                if fn.endswith(".conf"):
-                    paths.append(os.path.join(d, fn))
-        for p in paths:
-            try:
-                with open(p) as f:
-                    for ln in f:
-                        ls = ln.strip()
-                        if ls.startswith("FEATURES=") and not features:
-                            features = ls.split("=",1)[1].strip().strip('"\\'+"'"+'')
-                        elif ls.startswith("EMERGE_DEFAULT_OPTS=") and not opts:
-                            opts = ls.split("=",1)[1].strip().strip('"\\'+"'"+'')
-                        elif ls.startswith("PORTAGE_BINHOST=") and not binhost:
-                            binhost = ls.split("=",1)[1].strip().strip('"\\'+"'"+'')
-            except Exception:
-                pass
+        # make.conf and make.conf.d/ values, reparsed only if the files changed
+        try:
+            values = self.config_snapshot.make_conf()
+            self.config_snapshot.save()
+        except Exception:
+            values = {}
+        features = values.get("FEATURES", "")
+        opts = values.get("EMERGE_DEFAULT_OPTS", "")
+        binhost = values.get("PORTAGE_BINHOST", "")
         self.chk_buildpkg.set_active("buildpkg" in features)
         self.chk_usepkg.set_active("getbinpkg" in opts or "--getbinpkg" in opts or "--usepkg" in opts)
         self.binhost_entry.set_text(binhost)
@@ -1,4 +1,4 @@
-import os, logging
+import os, re, logging
 
 debug = logging.getLogger("portatoLogger").debug
 info = logging.getLogger("portatoLogger").info
@@ -24,36 +24,49 @@ def get_runsystem():
         return ("Unknown", "")
 
 
+PAREN_TOKEN = re.compile(r"[()]|[^\s()]+")
+
+
+class DependencyStringError(ValueError):
+    def __init__(self, msg, mystr, pos):
+
+        ValueError.__init__(self, "%s at position %d" % (msg, pos))
+        self.mystr = mystr
+        self.pos = pos
+
+
+def iter_paren_tokens(mystr):
+
+    opened = []
+    for m in PAREN_TOKEN.finditer(mystr):
+        token = m.group()
+        if token == "(":
+            opened.append(m.start())
+        elif token == ")":
+            if not opened:
+                raise DependencyStringError(_("Unbalanced ')'"), mystr, m.start())
+            opened.pop()
+
+        yield m.start(), token
+
+    if opened:
+        raise DependencyStringError(_("Unclosed '('"), mystr, opened[-1])
+
+
 def paren_reduce(mystr):
 
-    mylist = []
-    while mystr:
-        left_paren = mystr.find("(")
-        has_left_paren = left_paren != -1
-        right_paren = mystr.find(")")
-        has_right_paren = right_paren != -1
-        if not has_left_paren and not has_right_paren:
-            freesec = mystr
-            subsec = None
-            tail = ""
-        elif mystr[0] == ")":
-            return [mylist, mystr[1:]]
-        elif has_left_paren and not has_right_paren:
-            error(_("Invalid dependency string"))
-            return []
-        elif has_left_paren and left_paren < right_paren:
-            freesec, subsec = mystr.split("(", 1)
-            subsec, tail = paren_reduce(subsec)
+    stack = [[]]
+    for pos, token in iter_paren_tokens(mystr):
+        if token == "(":
+            sub = []
+            stack[-1].append(sub)
+            stack.append(sub)
+        elif token == ")":
+            stack.pop()
         else:
-            subsec, tail = mystr.split(")", 1)
-            subsec = [_f for _f in subsec.split(" ") if _f]
-            return [mylist + subsec, tail]
-        mystr = tail
-        if freesec:
-            mylist = mylist + [_f for _f in freesec.split(" ") if _f]
-        if subsec is not None:
-            mylist = mylist + [subsec]
-    return mylist
+            stack[-1].append(token)
+
+    return stack[0]
 
 
 def flatten(listOfLists):
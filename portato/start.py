@@ -1,4 +1,8 @@
-import argparse, os, subprocess, sys, shlex, textwrap, pathlib
+import argparse, os, re, subprocess, sys, shlex, textwrap, pathlib
+
+# a USE flag as 'portato use' takes it: flag, -flag (disable) or ~flag (revert)
+USE_FLAG = re.compile(r"^[-~]?[A-Za-z0-9][A-Za-z0-9+_@-]*$")
+USE_OPTIONS = ("-p", "--pretend", "-f", "--file")
 
 def _run(cmd, check=False):
     try:
@@ -65,6 +69,142 @@ def cmd_remove(args):
     print("->", " ".join(shlex.quote(c) for c in cmd))
     os.execvp(cmd[0], cmd)
 
+def _split_use_args(args):
+    # REMAINDER hands everything after the atom over verbatim: pick out the
+    # exact option tokens, parse them, and keep the rest as flags
+    opts, flags = [], []
+    it = iter(args.flags)
+    for t in it:
+        if t == "--":
+            flags.extend(it)
+        elif t in USE_OPTIONS or t.startswith("--file="):
+            opts.append(t)
+            if t in ("-f", "--file"):
+                opts.append(next(it, ""))
+        else:
+            flags.append(t)
+    if opts:
+        p = argparse.ArgumentParser(prog="portato use", add_help=False)
+        _add_use_options(p)
+        rest = p.parse_known_args(opts, args)[1]
+        flags.extend(rest)
+    args.flags = flags
+    return args
+
+def _add_use_options(p):
+    p.add_argument("-f", "--file", help="read 'atom flag...' lines from FILE ('-' for stdin)")
+    p.add_argument("-p", "--pretend", action="store_true", help="only show the resulting package.use diff")
+
+def _bad_use_flags(changes):
+    return [f for atom, fl in changes for f in fl if not USE_FLAG.match(f)]
+
+def _read_use_changes(args):
+    changes = []
+    if args.file:
+        f = sys.stdin if args.file == "-" else open(args.file)
+        try:
+            for ln in f:
+                parts = ln.split("#", 1)[0].split()
+                if len(parts) > 1:
+                    changes.append((parts[0], parts[1:]))
+        finally:
+            if f is not sys.stdin:
+                f.close()
+    if args.atom and args.flags:
+        changes.append((args.atom, args.flags))
+    return changes
+
+def cmd_use(args):
+    args = _split_use_args(args)
+    try:
+        changes = _read_use_changes(args)
+    except OSError as e:
+        print(f"Could not read {args.file}: {e}")
+        return 1
+    if not changes:
+        print("Usage: portato use [-p] <atom> <flag>... | portato use [-p] -f <file>")
+        return 2
+    bad = _bad_use_flags(changes)
+    if bad:
+        print("Not a USE flag:", " ".join(shlex.quote(f) for f in bad))
+        return 2
+    try:
+        from .backend import flags
+    except ImportError as e:
+        print("Portage backend unavailable:", e)
+        return 1
+    resolved = []
+    for atom, fl in changes:
+        cpv = flags.find_use_target(atom)
+        if cpv is None:
+            print(f"No package matches {atom}, skipping.")
+            continue
+        resolved.append((cpv, fl))
+    for pkg in flags.set_use_flags(resolved):
+        print(pkg.get_cpv(), " ".join(flags.sort_use_flag_list(flags.get_new_use_flags(pkg))))
+    if args.pretend:
+        print(flags.diff_changes(masked=False, testing=False), end="")
+        return 0
+    try:
+        flags.write_use_flags()
+    except OSError as e:
+        print(f"Could not write package.use: {e}")
+        return 1
+
+def cmd_usediff(args):
+    try:
+        from .backend import system
+        from .backend.use_state import diff_use
+    except ImportError as e:
+        print("Portage backend unavailable:", e)
+        return 1
+    pkgs = []
+    for atom in (args.a, args.b):
+        cpv = system.find_best_match(atom, only_cpv=True)
+        if cpv is None:
+            print(f"No package matches {atom}.")
+            return 2
+        pkgs.append(system.new_package(cpv))
+    for pkg, only in zip(pkgs, diff_use(*pkgs)):
+        print(f"{pkg.get_cpv()}: {' '.join(sorted(only)) or '(nothing else)'}")
+
+def cmd_rdeps(args):
+    if not args.atom:
+        print("Usage: portato rdeps <atom>")
+        return 2
+    try:
+        from .backend.revdeps import REVDEPS
+    except ImportError as e:
+        print("Portage backend unavailable:", e)
+        return 1
+    try:
+        found = REVDEPS.rdepends(args.atom)
+    except ValueError as e:
+        print(e)
+        return 2
+    if not found:
+        print(f"No installed package depends on {args.atom}.")
+        return 0
+    for cpv, dep in found:
+        print(f"{cpv}  ({dep})")
+
+def cmd_depgraph(args):
+    try:
+        from .backend.depgraph import installed_graph
+    except ImportError as e:
+        print("Portage backend unavailable:", e)
+        return 1
+    graph = installed_graph(args.atoms or None)
+    if args.cycles:
+        cycles = graph.cycles()
+        for c in cycles:
+            print(" -> ".join(c))
+        return 1 if cycles else 0
+    if args.format == "dot":
+        graph.write_dot(sys.stdout)
+    else:
+        graph.write_jsonl(sys.stdout)
+
 def main(argv=None):
     argv = argv or sys.argv[1:]
     p = argparse.ArgumentParser(prog="portato", description="Portato (Almost): a small Gentoo Portage helper")
@@ -88,6 +228,28 @@ def main(argv=None):
     s_remove.add_argument("atom", nargs="?")
     s_remove.set_defaults(func=cmd_remove)
 
+    s_rdeps = sub.add_parser("rdeps", help="List installed packages depending on an atom")
+    s_rdeps.add_argument("atom", nargs="?")
+    s_rdeps.set_defaults(func=cmd_rdeps)
+
+    s_udiff = sub.add_parser("usediff", help="Compare the effective USE of two packages")
+    s_udiff.add_argument("a")
+    s_udiff.add_argument("b")
+    s_udiff.set_defaults(func=cmd_usediff)
+
+    s_graph = sub.add_parser("depgraph", help="Export the dependency graph of installed packages")
+    s_graph.add_argument("atoms", nargs="*", help="start from these atoms instead of the whole installed set")
+    s_graph.add_argument("--format", choices=("jsonl", "dot"), default="jsonl")
+    s_graph.add_argument("--cycles", action="store_true", help="only list circular dependencies")
+    s_graph.set_defaults(func=cmd_depgraph)
+
+    s_use = sub.add_parser("use", help="Set USE flags for one or many packages in package.use")
+    s_use.add_argument("atom", nargs="?")
+    # REMAINDER, so '-flag' after the atom is not taken for an option
+    s_use.add_argument("flags", nargs=argparse.REMAINDER, help="flags to set, '-flag' to disable")
+    _add_use_options(s_use)
+    s_use.set_defaults(func=cmd_use)
+
     s_gui = sub.add_parser("gui", help="Launch GTK3 GUI (preview)")
     s_gui.set_defaults(func=cmd_gui)
 
@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+
+def write_vdb(vdb, cpv, **files):
+
+    path = os.path.join(vdb, cpv)
+    os.makedirs(path)
+    for name, value in files.items():
+        with open(os.path.join(path, name), "w") as f:
+            f.write(value + "\n")
+
+
+class RevdepsImportTest(unittest.TestCase):
+    def setUp(self):
+
+        self.tmp = tempfile.mkdtemp()
+        self.vdb = os.path.join(self.tmp, "pkg")
+        write_vdb(self.vdb, "dev-libs/libfoo-1.0", SLOT="0")
+        write_vdb(self.vdb, "app-misc/bar-2.0", SLOT="0", USE="foo",
+                  RDEPEND="foo? ( >=dev-libs/libfoo-1 ) !app-misc/baz")
+
+    def tearDown(self):
+
+        shutil.rmtree(self.tmp)
+
+    def test_rdepends(self):
+
+        # the module is imported for real: no portage backend may be needed
+        # for the reverse dependencies of the installed set
+        from portato.backend.installed import InstalledIndex
+        from portato.backend.revdeps import RevdepIndex
+
+        index = RevdepIndex(InstalledIndex(self.vdb), os.path.join(self.tmp, "revdeps"))
+        self.assertEqual(index.rdepends("dev-libs/libfoo"),
+                         [("app-misc/bar-2.0", ">=dev-libs/libfoo-1")])
+
+
+if __name__ == "__main__":
+    unittest.main()